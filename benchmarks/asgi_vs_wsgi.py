@@ -0,0 +1,167 @@
+"""
+Concurrent-client throughput of the current deployment (gunicorn gthread workers, as in
+the Procfile) against the ASGI entry point (uvicorn workers, views on a thread pool).
+
+Both servers get the same number of processes and of request threads per process, and
+the same seeded SQLite database. For
+every --concurrency level, that many keep-alive clients hammer the API for --duration
+seconds with a mix of todo listings, todo creations and logins.
+
+    $ pipenv install
+    $ python benchmarks/asgi_vs_wsgi.py --workers 2 --concurrency 1 8 32 64
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SRC = os.path.join(ROOT, "src")
+PASSWORD = "bench-password"
+
+BENCH_ENV = {
+    "DATABASE_URL": "sqlite:///" + os.path.join(tempfile.mkdtemp(), "asgi.db"),
+    "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+    "LOGIN_RATE_IP_PER_MINUTE": "0",
+    "LOGIN_RATE_EMAIL_PER_MINUTE": "0",
+    # both servers have to accept the tokens signed here
+    "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY") or os.urandom(32).hex(),
+}
+os.environ.update(BENCH_ENV)
+sys.path.insert(0, SRC)
+
+from app import app  # noqa: E402
+from api.models import db  # noqa: E402
+from api.seed import generate_test_data  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(command, port):
+    process = subprocess.Popen(command, cwd=SRC, env={**os.environ, **BENCH_ENV},
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{command[2]} exited with status {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/api/health-check")
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{command[2]} did not come up within 30s")
+
+
+def client(port, tokens, users, deadline, latencies, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    rng = random.Random()
+    while time.monotonic() < deadline:
+        n = rng.randrange(len(tokens))
+        roll = rng.random()
+        if roll < 0.8:
+            method, path, body, token = "GET", "/api/todos", None, tokens[n]
+        elif roll < 0.9:
+            method, path, body, token = "POST", "/api/todos", {"label": "bench"}, tokens[n]
+        else:
+            method, path, body, token = "POST", "/api/login", {"email": users[n], "password": PASSWORD}, None
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=json.dumps(body) if body else None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+        except (http.client.HTTPException, OSError):
+            errors.append("connection")
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def measure(port, concurrency, duration, tokens, users):
+    latencies, errors = [], []  # list.append is atomic, no lock needed
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client, args=(port, tokens, users, deadline, latencies, errors))
+               for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000 if latencies else 0
+
+    return {"rps": len(latencies) / duration, "p50_ms": pct(50), "p99_ms": pct(99), "errors": len(errors)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=2, help="server processes on both sides")
+    parser.add_argument("--threads", type=int, default=8, help="request threads per worker on both sides")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--todos-per-user", type=int, default=50)
+    args = parser.parse_args()
+
+    missing = [name for name in ("gunicorn", "uvicorn") if importlib.util.find_spec(name) is None]
+    if missing:
+        raise SystemExit(f"{' and '.join(missing)} not installed (pipenv install {' '.join(missing)})")
+
+    with app.app_context():
+        db.create_all()
+        generate_test_data(args.users, args.todos_per_user, password=PASSWORD, prefix="bench")
+    users = [f"bench{n}@test.com" for n in range(1, args.users + 1)]
+    client_app = app.test_client()
+    tokens = [client_app.post("/api/login", json={"email": email, "password": PASSWORD}).get_json()["token"]
+              for email in users]
+
+    servers = {
+        "gunicorn gthread": lambda port: [sys.executable, "-m", "gunicorn", "wsgi", "--bind", f"127.0.0.1:{port}",
+                                          "--workers", str(args.workers), "-k", "gthread",
+                                          "--threads", str(args.threads)],
+        "uvicorn asgi": lambda port: [sys.executable, "-m", "uvicorn", "asgi:application", "--port", str(port),
+                                      "--workers", str(args.workers), "--log-level", "warning"],
+    }
+    BENCH_ENV["ASGI_THREADS"] = BENCH_ENV["WEB_THREADS"] = str(args.threads)
+    results = {}
+    for name, command in servers.items():
+        port = free_port()
+        process = start(command(port), port)
+        try:
+            for concurrency in args.concurrency:
+                results[(name, concurrency)] = measure(port, concurrency, args.duration, tokens, users)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"{'clients':>8} {'server':<16} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for concurrency in args.concurrency:
+        for name in servers:
+            r = results[(name, concurrency)]
+            print(f"{concurrency:>8} {name:<16} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Per-request cost of JWT authentication, with and without the verified-token cache
+(api.tokens).
+
+Two routes are added to the app for the run, identical except that one is behind
+@jwt_required(); the difference between them is what authenticating a request costs
+(token decode, identity lookup and the revocation check). The decode alone is timed
+too. Every request replays one token, like a browser session does.
+
+    $ python benchmarks/bench_auth.py --requests 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "auth.db"))
+os.environ.setdefault("PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+os.environ.setdefault("JWT_SECRET_KEY", os.urandom(32).hex())
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flask_jwt_extended import create_access_token, decode_token, get_jwt_identity, jwt_required  # noqa: E402
+from app import app, jwt  # noqa: E402
+from api.models import db  # noqa: E402
+
+
+def protected():
+    return {"id": get_jwt_identity()}
+
+
+def unprotected():
+    return {"id": None}
+
+
+app.add_url_rule("/bench/protected", view_func=jwt_required()(protected))
+app.add_url_rule("/bench/unprotected", view_func=unprotected)
+
+
+def per_request(client, path, headers, requests):
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = client.get(path, headers=headers)
+        best = min(best, time.perf_counter() - started)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return best / requests
+
+
+def per_decode(token, decodes):
+    best = float("inf")
+    with app.app_context():
+        for _ in range(3):
+            started = time.perf_counter()
+            for _ in range(decodes):
+                decode_token(token)
+            best = min(best, time.perf_counter() - started)
+    return best / decodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20_000, help="requests per route and run")
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        token = create_access_token(identity="1", additional_claims={"jti": os.urandom(16).hex()})
+    headers = {"Authorization": f"Bearer {token}"}
+    client = app.test_client()
+
+    cache = jwt.verified_tokens
+    size = cache.max_entries or 10_000
+    print(f"{'':<16} {'decode us':>10} {'open req us':>12} {'auth req us':>12} {'auth overhead us':>17}")
+    for name, max_entries in (("full decode", 0), ("verified cache", size)):
+        cache.max_entries = max_entries
+        cache.clear()
+        decode = per_decode(token, args.requests)
+        base = per_request(client, "/bench/unprotected", headers, args.requests)
+        auth = per_request(client, "/bench/protected", headers, args.requests)
+        print(f"{name:<16} {decode * 1e6:>10.1f} {base * 1e6:>12.1f} {auth * 1e6:>12.1f} {(auth - base) * 1e6:>17.1f}")
+    print(f"cache: {cache.collect()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares Flask's stdlib JSON provider with api.json_provider.FastJSONProvider
+(orjson when installed) on /api/todos-shaped payloads.
+
+    $ python benchmarks/json_encode.py --sizes 100 10000 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from api.json_provider import FastJSONProvider, orjson  # noqa: E402
+from api.models import Todos  # noqa: E402
+
+
+def payload(size):
+    rows = [(i, f"todo number {i}", i % 3 == 0, 1) for i in range(size)]
+    return {"todos": [Todos.serialize_row(row) for row in rows], "user_id": "1", "version": 1}
+
+
+def timeit(provider, app, obj, repeat):
+    best = float("inf")
+    with app.app_context():
+        for _ in range(repeat):
+            started = time.perf_counter()
+            provider.response(obj).get_data()
+            best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    stdlib, fast = DefaultJSONProvider(app), FastJSONProvider(app)
+    print(f"fast encoder: {'orjson ' + orjson.__version__ if orjson else 'not installed (stdlib fallback)'}")
+    print(f"{'items':>8} {'stdlib ms':>10} {'fast ms':>9} {'speedup':>8}")
+    for size in args.sizes:
+        obj = payload(size)
+        with app.app_context():
+            assert fast.loads(fast.response(obj).get_data()) == stdlib.loads(stdlib.response(obj).get_data())
+        old = timeit(stdlib, app, obj, args.repeat)
+        new = timeit(fast, app, obj, args.repeat)
+        print(f"{size:>8} {old * 1000:>10.2f} {new * 1000:>9.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
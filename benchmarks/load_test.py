@@ -0,0 +1,304 @@
+"""
+End-to-end load test of the API: seeds a database, then runs the same scenario
+(register, login, create/list/update/delete todos, list a seeded user's todos, logout)
+against the Flask test client and/or a real gunicorn server, and reports p50/p95/p99
+latency per operation and overall throughput.
+
+    $ python benchmarks/load_test.py --users 1000 --todos-per-user 50 --iterations 200 \\
+          --target both --output before.json
+    $ python benchmarks/load_test.py ... --output after.json
+    $ python benchmarks/load_test.py --compare before.json after.json
+
+The database is a throwaway SQLite file unless --database-url points somewhere else
+(e.g. a local Postgres); it must be empty, the tables are created here.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PASSWORD = "bench-password"
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--users", type=int, default=200, help="seeded users")
+parser.add_argument("--todos-per-user", type=int, default=20, help="seeded todos per user")
+parser.add_argument("--iterations", type=int, default=100, help="scenario runs per target")
+parser.add_argument("--concurrency", type=int, default=4, help="scenarios running at once")
+parser.add_argument("--target", choices=["client", "gunicorn", "both"], default="client")
+parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+parser.add_argument("--threads", type=int, default=4, help="gunicorn threads per worker")
+parser.add_argument("--database-url", help="database to seed and test against (default: temporary SQLite)")
+parser.add_argument("--hash-method", default="pbkdf2:sha256:1000",
+                    help="PASSWORD_HASH_METHOD for the run; cheap by default so hashing doesn't drown the rest")
+parser.add_argument("--output", help="write the results as JSON to this file")
+parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+args = parser.parse_args()
+
+if not args.compare:
+    DATABASE_URL = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load.db")
+    BENCH_ENV = {
+        "DATABASE_URL": DATABASE_URL,
+        "PASSWORD_HASH_METHOD": args.hash_method,
+        "LOGIN_RATE_IP_PER_MINUTE": "0",  # every request comes from 127.0.0.1
+        "LOGIN_RATE_EMAIL_PER_MINUTE": "0",
+        # the gunicorn workers have to accept the tokens signed here
+        "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY") or os.urandom(32).hex(),
+    }
+    os.environ.update(BENCH_ENV)
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+
+    from sqlalchemy import select  # noqa: E402
+    from app import app  # noqa: E402
+    from api.models import db, User  # noqa: E402
+    from api.seed import generate_test_data  # noqa: E402
+
+
+class ClientTransport:
+    """Requests through Flask's test client (one per thread): the app without any server."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = app.test_client()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HttpTransport:
+    """Requests over HTTP/1.1 keep-alive connections (one per thread)."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None  # the server closed the connection; retry once on a new one
+                if attempt:
+                    raise
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}  # operation -> [seconds]
+        self.errors = {}  # operation -> count
+
+    def call(self, transport, operation, expected, method, path, body=None, token=None):
+        started = time.perf_counter()
+        status, data = transport.request(method, path, body, token)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(operation, []).append(elapsed)
+            if status not in expected:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+        return status, data
+
+
+def scenario(transport, recorder, n, seeded_users):
+    call = recorder.call
+    email = f"load{n}-{os.urandom(4).hex()}@bench.test"
+    call(transport, "register", (201,), "POST", "/api/register",
+         {"email": email, "password": PASSWORD, "lastname": "load"})
+    status, data = call(transport, "login", (200,), "POST", "/api/login", {"email": email, "password": PASSWORD})
+    if status != 200:
+        return
+    token = json.loads(data)["token"]
+
+    ids = []
+    for i in range(3):
+        status, data = call(transport, "create_todo", (201,), "POST", "/api/todos", {"label": f"task {i}"}, token)
+        if status == 201:
+            ids.append(json.loads(data)["id"])
+    call(transport, "list_todos", (200,), "GET", "/api/todos", token=token)
+    for todo_id in ids[:2]:
+        call(transport, "update_todo", (200,), "PUT", f"/api/todos/{todo_id}", {"is_done": True}, token)
+    for todo_id in ids[2:]:
+        call(transport, "delete_todo", (204,), "DELETE", f"/api/todos/{todo_id}", token=token)
+    call(transport, "logout", (200,), "POST", "/api/logout", token=token)
+
+    if seeded_users:
+        seeded = f"seed{n % seeded_users + 1}@test.com"
+        status, data = call(transport, "login", (200,), "POST", "/api/login", {"email": seeded, "password": PASSWORD})
+        if status == 200:
+            token = json.loads(data)["token"]
+            call(transport, "list_seeded_todos", (200,), "GET", "/api/todos", token=token)
+            call(transport, "logout", (200,), "POST", "/api/logout", token=token)
+
+
+def percentile(sorted_samples, pct):
+    # nearest-rank
+    index = max(0, min(len(sorted_samples) - 1, int(round(pct / 100 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+def run(transport, iterations, concurrency, seeded_users):
+    recorder = Recorder()
+    scenario(transport, Recorder(), -1, seeded_users)  # warm-up, not recorded
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(scenario, transport, recorder, n, seeded_users) for n in range(iterations)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    operations = {}
+    for operation, samples in sorted(recorder.samples.items()):
+        samples.sort()
+        operations[operation] = {
+            "count": len(samples),
+            "errors": recorder.errors.get(operation, 0),
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+    total = sum(op["count"] for op in operations.values())
+    everything = sorted(s for samples in recorder.samples.values() for s in samples)
+    return {
+        "seconds": elapsed,
+        "requests": total,
+        "errors": sum(op["errors"] for op in operations.values()),
+        "throughput_rps": total / elapsed,
+        "scenarios_per_second": iterations / elapsed,
+        "p50_ms": percentile(everything, 50) * 1000,
+        "p95_ms": percentile(everything, 95) * 1000,
+        "p99_ms": percentile(everything, 99) * 1000,
+        "operations": operations,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers, threads):
+    if importlib.util.find_spec("gunicorn") is None:
+        raise SystemExit("gunicorn is not installed (pipenv install)")
+    port = free_port()
+    command = [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", os.path.join(ROOT, "src"),
+               "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "--threads", str(threads),
+               "--log-level", "warning"]
+    process = subprocess.Popen(command, env={**os.environ, **BENCH_ENV, "WEB_THREADS": str(threads)})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            status, _ = HttpTransport("127.0.0.1", port).request("GET", "/api/health-check")
+            if status == 200:
+                return process, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not come up within 30s")
+
+
+def print_results(name, result):
+    print(f"\n{name}: {result['requests']} requests in {result['seconds']:.2f}s, "
+          f"{result['throughput_rps']:.1f} req/s, {result['errors']} errors")
+    print(f"{'operation':<20} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for operation, stats in result["operations"].items():
+        print(f"{operation:<20} {stats['count']:>7} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['errors']:>7}")
+    print(f"{'all':<20} {result['requests']:>7} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+          f"{result['p99_ms']:>9.2f} {result['errors']:>7}")
+
+
+def _change(old, new):
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for target in sorted(set(base["targets"]) & set(new["targets"])):
+        old_result, new_result = base["targets"][target], new["targets"][target]
+        print(f"\n{target}: throughput {old_result['throughput_rps']:.1f} -> {new_result['throughput_rps']:.1f} req/s "
+              f"({_change(old_result['throughput_rps'], new_result['throughput_rps'])})")
+        print(f"{'operation':<20} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20}")
+        for operation in sorted(set(old_result["operations"]) | set(new_result["operations"])):
+            old_op, new_op = old_result["operations"].get(operation), new_result["operations"].get(operation)
+            if not old_op or not new_op:
+                print(f"{operation:<20} only in {'NEW' if new_op else 'BASE'}")
+                continue
+            cells = [f"{old_op[k]:.2f}>{new_op[k]:.2f} {_change(old_op[k], new_op[k]):>7}"
+                     for k in ("p50_ms", "p95_ms", "p99_ms")]
+            print(f"{operation:<20} " + " ".join(f"{cell:>20}" for cell in cells))
+
+
+def main():
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        generate_test_data(args.users, args.todos_per_user, password=PASSWORD, prefix="seed")
+        seeded = db.session.execute(select(db.func.count()).select_from(User)).scalar()
+        backend = db.engine.url.get_backend_name()
+        print(f"Seeded {seeded} users / {args.users * args.todos_per_user} todos "
+              f"in {time.perf_counter() - started:.1f}s ({db.engine.url.render_as_string(hide_password=True)})")
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "database": backend,
+            **{k: v for k, v in vars(args).items() if k not in ("compare", "output", "database_url")},
+        },
+        "targets": {},
+    }
+    if args.target in ("client", "both"):
+        results["targets"]["client"] = run(ClientTransport(), args.iterations, args.concurrency, args.users)
+        print_results("test client", results["targets"]["client"])
+    if args.target in ("gunicorn", "both"):
+        process, port = start_gunicorn(args.workers, args.threads)
+        try:
+            results["targets"]["gunicorn"] = run(HttpTransport("127.0.0.1", port), args.iterations,
+                                                 args.concurrency, args.users)
+        finally:
+            process.terminate()
+            process.wait()
+        print_results(f"gunicorn ({args.workers} workers x {args.threads} threads)", results["targets"]["gunicorn"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares the per-request cost of listing a user's todos the old way (ORM instances with
+the owner joined in, then serialize()) against the column query in api.queries.
+
+    $ python benchmarks/todos_query.py --sizes 1000 10000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["DATABASE_URL"] = "sqlite:///" + DB_FILE
+os.environ.setdefault("JWT_SECRET_KEY", os.urandom(32).hex())
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import joinedload  # noqa: E402
+from app import app  # noqa: E402
+from api.models import db, User, Todos  # noqa: E402
+from api.queries import select_todos  # noqa: E402
+
+
+def seed(count):
+    user = User(email=f"bench{count}@test.com", password_hash="x", lastname="bench", salt="x")
+    db.session.add(user)
+    db.session.commit()
+    db.session.execute(insert(Todos), [
+        {"label": f"todo {i}", "is_done": i % 3 == 0, "user_id": user.id} for i in range(count)])
+    db.session.commit()
+    return user.id
+
+
+def orm_joined(user_id):
+    todos = Todos.query.options(joinedload(Todos.user)).filter_by(user_id=user_id).all()
+    return [todo.serialize() for todo in todos]
+
+
+def column_rows(user_id):
+    return [Todos.serialize_row(row[1:]) for row in select_todos(user_id)]
+
+
+def timeit(fn, user_id, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        fn(user_id)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        print(f"{'todos':>8} {'orm+join ms':>12} {'rows ms':>10} {'speedup':>8}")
+        for size in args.sizes:
+            user_id = seed(size)
+            assert sorted(orm_joined(user_id), key=lambda t: t["id"]) == column_rows(user_id)
+            old = timeit(orm_joined, user_id, args.repeat)
+            new = timeit(column_rows, user_id, args.repeat)
+            print(f"{size:>8} {old * 1000:>12.2f} {new * 1000:>10.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -90,9 +90,17 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the full-text index tables (todos_fts*) are managed by hand-written migrations,
+    # they aren't in the models and autogenerate must not drop them
+    def include_object(object, name, type_, reflected, compare_to):
+        fts_table = type_ == "table" and name.startswith("todos_fts")
+        return not (fts_table and reflected and compare_to is None)
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
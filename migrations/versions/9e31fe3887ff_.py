@@ -0,0 +1,64 @@
+"""full-text search index on todos.label
+
+Revision ID: 9e31fe3887ff
+Revises: 0c2e9b4382c4
+Create Date: 2026-10-18 13:33:50.025899
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e31fe3887ff'
+down_revision = '0c2e9b4382c4'
+branch_labels = None
+depends_on = None
+
+# see src/api/search.py. Note for later SQLite migrations: batch_alter_table('todos')
+# recreates the table and drops these triggers with it, so they have to be created again.
+SQLITE_TRIGGERS = {
+    "todos_fts_insert": """
+        CREATE TRIGGER todos_fts_insert AFTER INSERT ON todos BEGIN
+            INSERT INTO todos_fts (rowid, owner, label) VALUES (new.id, new.user_id, new.label);
+        END""",
+    "todos_fts_delete": """
+        CREATE TRIGGER todos_fts_delete AFTER DELETE ON todos BEGIN
+            INSERT INTO todos_fts (todos_fts, rowid, owner, label) VALUES ('delete', old.id, old.user_id, old.label);
+        END""",
+    "todos_fts_update": """
+        CREATE TRIGGER todos_fts_update AFTER UPDATE OF label, user_id ON todos BEGIN
+            INSERT INTO todos_fts (todos_fts, rowid, owner, label) VALUES ('delete', old.id, old.user_id, old.label);
+            INSERT INTO todos_fts (rowid, owner, label) VALUES (new.id, new.user_id, new.label);
+        END""",
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        # contentless: the labels stay in todos only, the index keeps just the postings
+        op.execute("CREATE VIRTUAL TABLE todos_fts USING fts5(owner, label, content='', "
+                   "prefix='2 3', tokenize='unicode61 remove_diacritics 2')")
+        for trigger in SQLITE_TRIGGERS.values():
+            op.execute(trigger)
+        op.execute("INSERT INTO todos_fts (rowid, owner, label) SELECT id, user_id, label FROM todos")
+    elif dialect == "postgresql":
+        # both extensions are trusted, the database owner can create them
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_todos_user_id_label_fts ON todos "
+                   "USING gin (user_id, to_tsvector('simple', label))")
+        op.execute("CREATE INDEX ix_todos_user_id_label_trgm ON todos "
+                   "USING gin (user_id, label gin_trgm_ops)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for name in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+        op.execute("DROP TABLE IF EXISTS todos_fts")
+    elif dialect == "postgresql":
+        op.drop_index('ix_todos_user_id_label_trgm', table_name='todos')
+        op.drop_index('ix_todos_user_id_label_fts', table_name='todos')
@@ -0,0 +1,56 @@
+"""trigram index for the substring search fallback on SQLite
+
+Revision ID: b55357af64a3
+Revises: af81fe98a439
+Create Date: 2026-10-18 14:07:58.883394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b55357af64a3'
+down_revision = 'af81fe98a439'
+branch_labels = None
+depends_on = None
+
+# see src/api/search.py; Postgres has had its pg_trgm index since 9e31fe3887ff. The owner
+# is written as u<id>u, long enough to be a trigram and never a substring of another owner.
+# Like the todos_fts ones, these triggers go away when batch_alter_table('todos') runs.
+SQLITE_TRIGGERS = {
+    "todos_fts_trigram_insert": """
+        CREATE TRIGGER todos_fts_trigram_insert AFTER INSERT ON todos BEGIN
+            INSERT INTO todos_fts_trigram (rowid, owner, label) VALUES (new.id, 'u' || new.user_id || 'u', new.label);
+        END""",
+    "todos_fts_trigram_delete": """
+        CREATE TRIGGER todos_fts_trigram_delete AFTER DELETE ON todos BEGIN
+            INSERT INTO todos_fts_trigram (todos_fts_trigram, rowid, owner, label)
+            VALUES ('delete', old.id, 'u' || old.user_id || 'u', old.label);
+        END""",
+    "todos_fts_trigram_update": """
+        CREATE TRIGGER todos_fts_trigram_update AFTER UPDATE OF label, user_id ON todos BEGIN
+            INSERT INTO todos_fts_trigram (todos_fts_trigram, rowid, owner, label)
+            VALUES ('delete', old.id, 'u' || old.user_id || 'u', old.label);
+            INSERT INTO todos_fts_trigram (rowid, owner, label) VALUES (new.id, 'u' || new.user_id || 'u', new.label);
+        END""",
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("CREATE VIRTUAL TABLE todos_fts_trigram USING fts5(owner, label, content='', "
+               "tokenize='trigram')")
+    for trigger in SQLITE_TRIGGERS.values():
+        op.execute(trigger)
+    op.execute("INSERT INTO todos_fts_trigram (rowid, owner, label) "
+               "SELECT id, 'u' || user_id || 'u', label FROM todos")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for name in SQLITE_TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    op.execute("DROP TABLE IF EXISTS todos_fts_trigram")
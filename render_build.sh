@@ -7,4 +7,6 @@ npm run build
 
 pipenv install
 
+pipenv run flask precompress-assets
+
 pipenv run upgrade
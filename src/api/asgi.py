@@ -0,0 +1,172 @@
+"""
+ASGI adapter for the Flask app (see src/asgi.py).
+
+The event loop owns the connections (keep-alive, slow clients, reading uploads and
+writing downloads) and the Flask views run unchanged on a thread pool, ASGI_THREADS
+threads per process (default: min(32, CPUs + 4)). Keep it at or below
+DB_POOL_SIZE + DB_MAX_OVERFLOW, or threads wait in the pool for a connection.
+
+Request and response bodies are streamed between the loop and the view thread, so the
+streaming endpoints (/api/user, /api/todos/export, /api/todos/import) keep their
+constant memory use. When the client disconnects, the response stops at its next chunk
+(an event stream sends one at least every heartbeat) and the iterable is closed.
+
+The views and the database stay synchronous: there is no async driver (aiosqlite,
+asyncpg) path, the thread pool is what lets a slow query or hash wait without holding up
+the other requests.
+"""
+import asyncio
+import io
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class _RequestBody(io.RawIOBase):
+    """wsgi.input reading http.request messages from the loop as the view consumes them."""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b""
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.request":
+                self._buffer = message.get("body", b"")
+                self._more = message.get("more_body", False)
+            else:  # http.disconnect
+                self._more = False
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _environ(scope, body):
+    root_path = scope.get("root_path", "")
+    path = scope["path"]
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        # WSGI carries paths as latin-1 decoded bytes
+        "SCRIPT_NAME": root_path.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,  # read to the end of the body, chunked uploads included
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = "HTTP_" + name
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+class WSGIThreadAdapter:
+    def __init__(self, wsgi_app, threads=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads or int(os.getenv("ASGI_THREADS", 0)) or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'")
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue(1)  # one message ahead of the view, so uploads still stream
+        disconnected = threading.Event()
+        watcher = loop.create_task(self._watch(receive, messages, disconnected))
+        try:
+            await loop.run_in_executor(self._executor, self._run, scope, messages.get, send, loop, disconnected)
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    async def _watch(receive, messages, disconnected):
+        """Passes the request messages on to the body reader, and flags http.disconnect."""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                await messages.put(message)
+                return
+            await messages.put(message)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _run(self, scope, receive, send, loop, disconnected):
+        """Runs the WSGI app on a pool thread, handing every message to the loop."""
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started and started[0] is True:
+                raise exc_info[1].with_traceback(exc_info[2])
+            started[:] = [int(status.split(" ", 1)[0]),
+                          [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]]
+            return lambda data: send_body(data, True)
+
+        def send_body(data, more):
+            if started[0] is not True:
+                status, headers = started
+                call({"type": "http.response.start", "status": status, "headers": headers})
+                started[0] = True
+            if data or not more:
+                call({"type": "http.response.body", "body": data, "more_body": more})
+
+        result = None
+        try:
+            result = self.wsgi_app(_environ(scope, _RequestBody(receive, loop)), start_response)
+            for chunk in result:
+                if disconnected.is_set():
+                    break  # nobody to send it to; closing the iterable below ends the response
+                if chunk:
+                    send_body(chunk, True)
+            else:
+                send_body(b"", False)
+        except Exception:
+            logger.exception("error serving %s %s", scope["method"], scope["path"])
+            if not started or started[0] is not True:
+                started[:] = [500, [(b"content-type", b"text/plain")]]
+                send_body(b"Internal Server Error", False)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
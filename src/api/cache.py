@@ -0,0 +1,274 @@
+"""
+Read-through cache for the per-user responses read on every page load: /api/me and
+the full todo list (GET /api/todos without parameters). Entries hold the encoded JSON
+body, plus the ETag for the todos so If-None-Match is answered without the database.
+
+Entries are dropped exactly when the data changes: every transaction that bumps a todo
+list version (api.queries.bump_todos_version) or updates/deletes a User through the ORM
+marks the user on the session, and the keys are invalidated once it commits. A read that
+started before an invalidation can't store its (possibly stale) result afterwards.
+
+The default backend lives in process memory (TTL + LRU, bounded by entries and bytes);
+invalidations reach the other gunicorn workers of the host through a journal. With
+USER_CACHE_STORE set, all workers share one SQLite file instead.
+
+    USER_CACHE_TTL_SECONDS     default 60 (0 disables the cache)
+    USER_CACHE_MAX_ENTRIES     default 10000
+    USER_CACHE_MAX_BYTES       memory backend size bound, default 64 MiB
+    USER_CACHE_MAX_ITEM_BYTES  bigger bodies aren't cached, default 1 MiB
+    USER_CACHE_STORE           path of a shared SQLite cache file (optional)
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.journal import Journal, journal_path
+from api.models import User
+from api.queries import CHANGED_TODO_LISTS
+
+CHANGED_USERS = "changed_users"  # session.info key, like CHANGED_TODO_LISTS
+
+
+def me_key(user_id):
+    return f"me:{int(user_id)}"
+
+
+def todos_key(user_id):
+    return f"todos:{int(user_id)}"
+
+
+class MemoryCacheBackend:
+    def __init__(self, ttl, max_entries=10_000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()  # key -> (value, tag, expires)
+        self._invalidated = OrderedDict()  # key -> time_ns of its last invalidation
+        self._floor = 0  # invalidation time of everything evicted from _invalidated
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def set(self, key, value, tag, token):
+        with self._lock:
+            if max(self._invalidated.get(key, 0), self._floor) >= token:
+                return False  # invalidated while the value was being read
+            self._drop(key)
+            self._entries[key] = (value, tag, time.monotonic() + self.ttl)
+            self.bytes += len(value)
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+            return True
+
+    def invalidate(self, keys, at):
+        with self._lock:
+            for key in keys:
+                self._drop(key)
+                self._invalidated[key] = max(at, self._invalidated.get(key, 0))
+                self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_entries:
+                _, oldest = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, oldest)
+
+    def clear(self, at):
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.clear()
+            self.bytes = 0
+            self._floor = max(self._floor, at)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[0])
+
+
+class SQLiteCacheBackend:
+    """Entries in a SQLite file shared by every worker on the host, so no journal is needed."""
+
+    def __init__(self, path, ttl, max_entries=10_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                     "(key TEXT PRIMARY KEY, value BLOB NOT NULL, tag TEXT NOT NULL, expires REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS invalidations (key TEXT PRIMARY KEY, at INTEGER NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM entries").fetchone()[0]
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value, tag FROM entries WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def set(self, key, value, tag, token):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, tag, expires) SELECT ?, ?, ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM invalidations WHERE key = ? AND at >= ?)",
+                (key, value, tag, time.time() + self.ttl, key, token)).rowcount > 0
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                now = time.time()
+                conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+                conn.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires DESC "
+                             "LIMIT -1 OFFSET ?)", (self.max_entries,))
+                # reads don't take longer than this, older invalidations can't matter
+                conn.execute("DELETE FROM invalidations WHERE at < ?", (int((now - max(self.ttl, 60)) * 1e9),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return stored
+
+    def invalidate(self, keys, at):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in keys:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.execute("INSERT INTO invalidations (key, at) VALUES (?, ?) "
+                             "ON CONFLICT (key) DO UPDATE SET at = max(at, excluded.at)", (key, at))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self, at):
+        self._connect().execute("DELETE FROM entries")
+
+
+class UserCache:
+    def __init__(self, backend, max_item_bytes=1024 * 1024):
+        self.backend = backend
+        self.max_item_bytes = max_item_bytes
+        self._journal = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "stale_stores_skipped": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+        if not ttl:
+            return cls(None)
+        max_entries = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10_000))
+        path = os.getenv("USER_CACHE_STORE")
+        backend = SQLiteCacheBackend(path, ttl, max_entries) if path else \
+            MemoryCacheBackend(ttl, max_entries, int(os.getenv("USER_CACHE_MAX_BYTES", 64 * 1024 * 1024)))
+        return cls(backend, int(os.getenv("USER_CACHE_MAX_ITEM_BYTES", 1024 * 1024)))
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @property
+    def shared(self):
+        return isinstance(self.backend, SQLiteCacheBackend)
+
+    def use_journal(self, path):
+        """Share invalidations with the other workers through `path` (memory backend only)."""
+        self._journal = Journal(path, replay=False)
+
+    def _poll_journal(self):
+        records, reset = self._journal.poll()
+        if reset:
+            self.backend.clear(time.time_ns())
+        for record in records:
+            key, _, at = record.partition(" ")
+            self.backend.invalidate([key], int(at))
+
+    def token(self):
+        """Taken before reading the data to cache; pass it to set()."""
+        return time.time_ns()
+
+    def get(self, key):
+        """(body, tag) or None."""
+        if self._journal is not None:
+            self._poll_journal()
+        entry = self.backend.get(key)
+        self._count("hits" if entry else "misses")
+        return entry
+
+    def set(self, key, value, tag, token):
+        if len(value) > self.max_item_bytes:
+            return
+        if self._journal is not None:
+            self._poll_journal()
+        if self.backend.set(key, value, tag, token):
+            self._count("stores")
+        else:
+            self._count("stale_stores_skipped")
+
+    def invalidate(self, keys):
+        at = time.time_ns()
+        self.backend.invalidate(keys, at)
+        self._count("invalidations", len(keys))
+        if self._journal is not None:
+            for key in keys:
+                self._journal.append(f"{key} {at}")
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def collect(self):
+        entries = len(self.backend) if self.enabled else 0
+        return {**self.stats, "entries": entries, "bytes": getattr(self.backend, "bytes", 0)}
+
+
+user_cache = UserCache.from_env()
+
+
+def setup_cache(app):
+    if not user_cache.enabled:
+        return
+    if not user_cache.shared:
+        user_cache.use_journal(journal_path("user_cache", app.config["SQLALCHEMY_DATABASE_URI"]))
+
+    @event.listens_for(User, "after_update")
+    @event.listens_for(User, "after_delete")
+    def mark_user_changed(mapper, connection, target):
+        # bump_todos_version updates the user row with a Core statement, which doesn't land here
+        Session.object_session(target).info.setdefault(CHANGED_USERS, set()).add(target.id)
+
+    @event.listens_for(Session, "after_commit")
+    def invalidate_committed(session):
+        keys = [me_key(user_id) for user_id in session.info.pop(CHANGED_USERS, ())]
+        keys += [todos_key(user_id) for user_id in session.info.pop(CHANGED_TODO_LISTS, ())]
+        if keys:
+            user_cache.invalidate(keys)
+
+    @event.listens_for(Session, "after_rollback")
+    def forget_rolled_back(session):
+        session.info.pop(CHANGED_USERS, None)
+        session.info.pop(CHANGED_TODO_LISTS, None)
@@ -1,6 +1,9 @@
 
 import click
-from api.models import db, User
+import os
+from api.revocation import purge_expired_tokens
+from api.compression import precompress_directory
+from api.seed import generate_test_data, DEFAULT_PASSWORD
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
@@ -12,23 +15,58 @@ def setup_commands(app):
     """ 
     This is an example command "insert-test-users" that you can run from the command line
     by typing: $ flask insert-test-users 5
-    Note: 5 is the number of users to add
+    Note: 5 is the number of users to add (password 123456 unless --password is given)
     """
     @app.cli.command("insert-test-users") # name of our command
-    @click.argument("count") # argument of out command
-    def insert_test_users(count):
+    @click.argument("count", type=int) # argument of out command
+    @click.option("--chunk-size", default=5000, show_default=True, help="rows inserted per transaction")
+    @click.option("--password", default=DEFAULT_PASSWORD, show_default=True, help="password of every test user")
+    def insert_test_users(count, chunk_size, password):
         print("Creating test users")
-        for x in range(1, int(count) + 1):
-            user = User()
-            user.email = "test_user" + str(x) + "@test.com"
-            user.password = "123456"
-            user.is_active = True
-            db.session.add(user)
-            db.session.commit()
-            print("User: ", user.email, " created.")
-
+        seed_with_progress(count, 0, chunk_size, password)
         print("All test users created")
 
+    """
+    Deletes expired rows from the revoked_token blocklist in small batches:
+    $ flask purge-revoked-tokens --batch-size 1000
+    """
+    @app.cli.command("purge-revoked-tokens")
+    @click.option("--batch-size", default=1000, show_default=True, help="rows deleted per transaction")
+    @click.option("--pause", default=0.0, show_default=True, help="seconds to wait between batches")
+    def purge_revoked_tokens(batch_size, pause):
+        print("Purging expired revoked tokens")
+        deleted, elapsed = purge_expired_tokens(batch_size, pause)
+        rate = deleted / elapsed if elapsed else deleted
+        print(f"Deleted {deleted} rows in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+
+    """
+    Writes .gz/.br copies of the built front end so they can be served without compressing
+    on every request; run it after `npm run build`: $ flask precompress-assets
+    """
+    @app.cli.command("precompress-assets")
+    @click.option("--directory", default=os.path.join(os.path.dirname(__file__), "..", "..", "dist"),
+                  show_default=True, help="build output to precompress")
+    def precompress_assets(directory):
+        written = precompress_directory(directory)
+        print(f"Wrote {written} precompressed files in {os.path.abspath(directory)}")
+
+    """
+    Generates users with todos for development and load testing, e.g. a million users
+    with 20 todos each: $ flask insert-test-data --users 1000000 --todos-per-user 20
+    """
     @app.cli.command("insert-test-data")
-    def insert_test_data():
-        pass
\ No newline at end of file
+    @click.option("--users", default=100, show_default=True, help="users to create")
+    @click.option("--todos-per-user", default=10, show_default=True, help="todos created for every user")
+    @click.option("--chunk-size", default=5000, show_default=True, help="rows inserted per transaction")
+    @click.option("--password", default=DEFAULT_PASSWORD, show_default=True, help="password of every test user")
+    def insert_test_data(users, todos_per_user, chunk_size, password):
+        print(f"Creating {users} users with {todos_per_user} todos each")
+        seed_with_progress(users, todos_per_user, chunk_size, password)
+
+    def seed_with_progress(users, todos_per_user, chunk_size, password):
+        def progress(users_done, rows, elapsed):
+            print(f"\r{users_done}/{users} users, {rows} rows, {rows / elapsed:.0f} rows/sec", end="", flush=True)
+
+        created, rows, elapsed = generate_test_data(
+            users, todos_per_user, chunk_size, password, progress=progress)
+        print(f"\nInserted {rows} rows ({created} users) in {elapsed:.2f}s ({rows / elapsed:.0f} rows/sec)")
\ No newline at end of file
@@ -0,0 +1,130 @@
+"""
+Response compression.
+
+API responses bigger than COMPRESS_MIN_SIZE bytes are compressed with brotli (when the
+`brotli` package is installed) or gzip, whichever the client prefers; streamed responses
+are compressed chunk by chunk so they keep streaming. Files sent from disk are left alone:
+the SPA build is precompressed once (`flask precompress-assets`) and the .br/.gz variants
+are served by api.static_files.
+
+    COMPRESS_MIN_SIZE   default 1024
+    COMPRESS_LEVEL      gzip level, default 6
+    COMPRESS_BR_QUALITY brotli quality for dynamic responses, default 4
+"""
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript",
+                      "application/xml", "image/svg+xml")
+COMPRESSIBLE_EXTENSIONS = (".html", ".js", ".mjs", ".css", ".json", ".svg", ".txt", ".map", ".xml", ".ico")
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def available_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(request, offered):
+    """The encoding in `offered` the client accepts with the highest quality (brotli wins ties)."""
+    best, best_quality = None, 0
+    for encoding in offered:
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _gzip_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def setup_compression(app):
+    min_size = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    level = int(os.getenv("COMPRESS_LEVEL", 6))
+    br_quality = int(os.getenv("COMPRESS_BR_QUALITY", 4))
+
+    @app.after_request
+    def compress_response(response):
+        from flask import request
+
+        if response.status_code < 200 or response.status_code in (204, 304) \
+                or response.direct_passthrough or "Content-Encoding" in response.headers \
+                or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES) \
+                or "no-transform" in response.headers.get("Cache-Control", ""):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(request, available_encodings())
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            chunks = response.response
+            response.response = _brotli_stream(chunks, br_quality) if encoding == "br" \
+                else _gzip_stream(chunks, level)
+            response.headers.pop("Content-Length", None)
+            if hasattr(chunks, "close"):
+                response.call_on_close(chunks.close)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(brotli.compress(data, quality=br_quality) if encoding == "br"
+                              else gzip.compress(data, compresslevel=level))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)  # same content, different bytes
+        return response
+
+
+def precompress_directory(root, min_size=1024):
+    """
+    Write a .gz (and .br when brotli is installed) next to every compressible file under
+    `root` that is at least `min_size` bytes, skipping variants newer than their source.
+    Returns the number of variants written.
+    """
+    written = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if not filename.endswith(COMPRESSIBLE_EXTENSIONS) or os.path.getsize(path) < min_size:
+                continue
+            with open(path, "rb") as f:
+                data = None
+                for encoding in available_encodings():
+                    target = path + ENCODING_SUFFIXES[encoding]
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    data = data if data is not None else f.read()
+                    compressed = brotli.compress(data, quality=11) if encoding == "br" \
+                        else gzip.compress(data, compresslevel=9, mtime=0)
+                    if len(compressed) >= len(data):
+                        continue
+                    with open(target, "wb") as out:
+                        out.write(compressed)
+                    written += 1
+    return written
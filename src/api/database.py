@@ -0,0 +1,80 @@
+"""
+Engine configuration from environment variables.
+
+Postgres:
+    DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30 s), DB_POOL_RECYCLE (1800 s),
+    DB_POOL_PRE_PING (1), DB_STATEMENT_TIMEOUT_MS (unset = no limit)
+SQLite (applied to every new connection):
+    SQLITE_JOURNAL_MODE (WAL), SQLITE_SYNCHRONOUS (NORMAL), SQLITE_BUSY_TIMEOUT_MS (5000),
+    SQLITE_MMAP_SIZE (268435456)
+
+Every gunicorn worker has its own pool, so the database sees up to
+WEB_CONCURRENCY x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections; the startup log line
+spells that out.
+"""
+import logging
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_url`."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        # the driver waits this long for a lock before raising "database is locked"
+        return {"connect_args": {"timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)) / 1000}}
+
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": _flag("DB_POOL_PRE_PING", "1"),
+    }
+    statement_timeout = os.getenv("DB_STATEMENT_TIMEOUT_MS")
+    if statement_timeout and url.get_backend_name() == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={int(statement_timeout)}"}
+    return options
+
+
+def _sqlite_pragmas():
+    return [
+        f"PRAGMA journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 268435456))}",
+    ]
+
+
+def setup_engine(app, db):
+    """Attach per-connection setup to the app's engine and log the effective pool settings."""
+    with app.app_context():
+        engine = db.engine
+
+    if engine.dialect.name == "sqlite":
+        pragmas = _sqlite_pragmas()
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+        logger.info("database: sqlite %s, pool=%s, %s", engine.url.database,
+                    type(engine.pool).__name__, "; ".join(pragmas))
+        return
+
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    per_worker = options.get("pool_size", 5) + options.get("max_overflow", 10)
+    logger.info("database: %s, pool=%s (%s), up to %d connections per worker, %d with %d workers",
+                engine.url.render_as_string(hide_password=True), type(engine.pool).__name__,
+                engine.pool.status(), per_worker, per_worker * workers, workers)
@@ -0,0 +1,281 @@
+"""
+Todo change notifications for GET /api/todos/stream (server-sent events).
+
+The todo routes publish every committed change with the list version it was written
+at. Changes go through a journal file, so every gunicorn worker of the host sees them,
+and a relay thread in each worker fans them out to the streams open there. Each stream
+has a bounded queue; a consumer that falls TODO_EVENTS_QUEUE_SIZE changes behind is sent
+a `resync` event and disconnected instead of buffering without limit.
+
+The last TODO_EVENTS_RING_SIZE changes of every user are kept so a reconnecting client
+(Last-Event-ID = the last version it saw) gets what it missed; when they no longer
+cover that version it gets `resync` and reloads with GET /api/todos?since=<version>.
+
+Every open stream occupies a worker thread for up to TODO_EVENTS_MAX_AGE_SECONDS, after
+which the browser reconnects on its own. The entry points call fit_threads() with the
+threads each process serves requests on (WEB_THREADS for gunicorn's gthread workers, as
+in the Procfile; ASGI_THREADS for src/asgi.py), and streams may take at most half of
+them, so the other views always keep threads. With one thread (sync workers) streams
+are refused with a 503.
+
+    TODO_EVENTS_MAX_STREAMS        per process, default 100 (503 beyond), capped by fit_threads()
+    TODO_EVENTS_QUEUE_SIZE         default 256
+    TODO_EVENTS_RING_SIZE          per user, default 100
+    TODO_EVENTS_HEARTBEAT_SECONDS  default 15
+    TODO_EVENTS_MAX_AGE_SECONDS    default 300
+    TODO_EVENTS_POLL_SECONDS       journal poll interval of the relay, default 0.25
+"""
+import bisect
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from api.journal import Journal
+
+RETRY_MS = 3000
+MAX_RING_USERS = 10_000
+
+
+def _now_version():
+    return int(time.time() * 1_000_000)
+
+
+def _recent_record(record):
+    # records are "<user_id> <version> <json>"; versions are microsecond timestamps
+    return int(record.split(" ", 2)[1]) > _now_version() - 60_000_000
+
+
+class Subscriber:
+    def __init__(self, user_id, max_queue):
+        self.user_id = user_id
+        self.queue = queue.Queue(max_queue)
+        self.overflowed = False
+        self.resync_since = None  # below the oldest change it didn't get, once overflowed
+
+
+class _Ring:
+    """
+    A user's recent changes in version order. Versions are taken in commit order, but two
+    writes can reach publish() the other way round; the later-arriving, lower version is
+    still inserted in place, and remembered as late until the version that was last then.
+    """
+
+    def __init__(self, size, floor):
+        self.size = size
+        self.entries = []  # (version, changes, late_until or None), by version
+        self.versions = set()
+        self.complete_after = floor  # every change after this version is in entries
+        self.last = floor
+
+    def insert(self, version, changes):
+        late_until = self.last if version < self.last else None
+        bisect.insort(self.entries, (version, changes, late_until), key=lambda entry: entry[0])
+        self.versions.add(version)
+        self.last = max(self.last, version)
+        if len(self.entries) > self.size:
+            evicted = self.entries.pop(0)
+            self.versions.discard(evicted[0])
+            self.complete_after = evicted[0]
+
+    def after(self, version):
+        """
+        The changes a client that saw up to `version` may lack: the later ones, and the
+        late ones it can't have seen because they arrived after what it saw.
+        """
+        return [(entry_version, changes) for entry_version, changes, late_until in self.entries
+                if entry_version > version or (late_until is not None and late_until >= version)]
+
+
+class TodoEventHub:
+    def __init__(self, max_streams=100, max_queue=256, ring_size=100, heartbeat=15.0,
+                 max_age=300.0, poll_interval=0.25):
+        self.max_streams = max_streams
+        self.max_queue = max_queue
+        self.ring_size = ring_size
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of Subscriber
+        self._rings = OrderedDict()  # user_id -> _Ring, least recently changed first
+        self._floor = _now_version()
+        self._journal = None
+        self._relay = None
+        self.stats = {"streams": 0, "published": 0, "delivered": 0, "overflows": 0, "resyncs": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_streams=int(os.getenv("TODO_EVENTS_MAX_STREAMS", 100)),
+            max_queue=int(os.getenv("TODO_EVENTS_QUEUE_SIZE", 256)),
+            ring_size=int(os.getenv("TODO_EVENTS_RING_SIZE", 100)),
+            heartbeat=float(os.getenv("TODO_EVENTS_HEARTBEAT_SECONDS", 15)),
+            max_age=float(os.getenv("TODO_EVENTS_MAX_AGE_SECONDS", 300)),
+            poll_interval=float(os.getenv("TODO_EVENTS_POLL_SECONDS", 0.25)),
+        )
+
+    def fit_threads(self, threads):
+        """Leave at least half of the process's `threads` request threads to the other views."""
+        self.max_streams = min(self.max_streams, threads // 2)
+
+    def use_journal(self, path):
+        """Relay changes between the workers through the journal file at `path`."""
+        self._journal = Journal(path, keep=_recent_record, replay=False)
+
+    def publish(self, user_id, version, changes):
+        """
+        Announce the changes committed at `version`: a list of (event, data) pairs,
+        e.g. [("created", todo), ("deleted", {"id": 3})]. Call after the commit.
+        """
+        with self._lock:
+            self.stats["published"] += 1
+        if self._journal is None:
+            self._dispatch(int(user_id), version, changes)
+            return
+        self._journal.append(f"{int(user_id)} {version} {json.dumps(changes, separators=(',', ':'))}")
+
+    def _start_relay(self):
+        # started with the first stream; only changes seen from then on can be replayed
+        with self._lock:
+            if self._relay is not None:
+                return
+            self._journal.poll()  # skip whatever was written before
+            self._floor = _now_version()
+            self._relay = threading.Thread(target=self._run_relay, name="todo-events", daemon=True)
+        self._relay.start()
+
+    def _run_relay(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                records, replayed = self._journal.poll()
+            except OSError:
+                continue
+            # after a compaction the recent records are replayed; the rings drop the duplicates
+            for record in records:
+                user_id, version, changes = record.split(" ", 2)
+                self._dispatch(int(user_id), int(version), json.loads(changes), replayed)
+
+    def _dispatch(self, user_id, version, changes, replayed=False):
+        with self._lock:
+            ring = self._rings.pop(user_id, None) or _Ring(self.ring_size, self._floor)
+            self._rings[user_id] = ring
+            if len(self._rings) > MAX_RING_USERS:
+                self._rings.popitem(last=False)
+                self._floor = _now_version()  # that user's history is gone
+            if version in ring.versions or (replayed and version <= ring.complete_after):
+                return  # replayed after a journal compaction
+            subscribers = self._subscribers.get(user_id, ())
+            if version <= ring.complete_after:
+                # too late to place in the ring: whoever watches this user has to reload
+                for subscriber in subscribers:
+                    self._overflow(subscriber, version)
+                return
+            ring.insert(version, changes)
+            for subscriber in subscribers:
+                try:
+                    subscriber.queue.put_nowait((version, changes))
+                    self.stats["delivered"] += 1
+                except queue.Full:
+                    self._overflow(subscriber, version)
+
+    def _overflow(self, subscriber, version):
+        # the resync has to reach back to before the change the subscriber didn't get
+        since = version - 1 if subscriber.resync_since is None else min(subscriber.resync_since, version - 1)
+        subscriber.resync_since = since
+        if not subscriber.overflowed:
+            subscriber.overflowed = True
+            self.stats["overflows"] += 1
+
+    def subscribe(self, user_id):
+        """A Subscriber for the user's changes, or None when this process has no stream slot left."""
+        if self._journal is not None and self._relay is None:
+            self._start_relay()
+        with self._lock:
+            if self.stats["streams"] >= self.max_streams:
+                return None
+            subscriber = Subscriber(int(user_id), self.max_queue)
+            self._subscribers.setdefault(subscriber.user_id, set()).add(subscriber)
+            self.stats["streams"] += 1
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.user_id)
+            if subscribers and subscriber in subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.user_id]
+                self.stats["streams"] -= 1
+
+    def missed(self, user_id, after):
+        """The changes after version `after`, or None when they are no longer all known."""
+        with self._lock:
+            ring = self._rings.get(int(user_id))
+            complete_after = ring.complete_after if ring else self._floor
+            if after < complete_after:
+                return None
+            return ring.after(after) if ring else []
+
+    def stream(self, subscriber, version, backlog, dumps, resumed=False):
+        """
+        The SSE body: `backlog` (missed changes) or a `ready` event at `version`, then live
+        changes, heartbeats, and `resync` when the client has to reload.
+
+        The event id is the highest version sent so far. A change that arrives late, below
+        it, is still sent; `resumed` says whether the client already has what `version`
+        covers (a reconnect) or is about to load it (a fresh stream, where a late change at
+        or below `version` is already in what it loads).
+        """
+        def message(event, data, event_id=None):
+            return (f"id: {event_id}\n" if event_id is not None else "") + f"event: {event}\ndata: {dumps(data)}\n\n"
+
+        def changes_messages(event_id, changes):
+            # only the last event of a change carries the id, so a client cut off in the
+            # middle resumes from the previous id and gets the whole change again
+            return "".join(message(event, data, event_id if i == len(changes) - 1 else None)
+                           for i, (event, data) in enumerate(changes))
+
+        def resync(since):
+            if subscriber.resync_since is not None:
+                since = min(since, subscriber.resync_since)
+            with self._lock:
+                self.stats["resyncs"] += 1
+            return message("resync", {"since": since})
+
+        seen = set()
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            if backlog is None:
+                yield resync(version)
+                return
+            cursor = version
+            for change_version, changes in backlog:
+                seen.add(change_version)
+                cursor = max(cursor, change_version)
+                yield changes_messages(cursor, changes)
+            if not backlog:
+                yield message("ready", {"version": version}, version)
+
+            deadline = time.monotonic() + self.max_age
+            while time.monotonic() < deadline:
+                if subscriber.overflowed:
+                    yield resync(cursor)
+                    return
+                try:
+                    change_version, changes = subscriber.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if change_version in seen or (not resumed and change_version <= version):
+                    continue
+                seen.add(change_version)
+                cursor = max(cursor, change_version)
+                yield changes_messages(cursor, changes)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+todo_events = TodoEventHub.from_env()
@@ -0,0 +1,111 @@
+"""
+Append-only local file used to broadcast small records between the gunicorn workers
+of one host (revocations, cache invalidations, ...).
+
+Writers append one line per record; every reader remembers its own offset, so an idle
+poll costs a single stat() call. When the file grows past max_bytes it is compacted:
+rewritten with only the records `keep` accepts and swapped in atomically. Readers notice
+the new inode and get a reset, replaying whatever was kept.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def journal_path(name, key=""):
+    # one file per app/database so two checkouts on the same machine don't share state
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"{name}-{digest}.journal")
+
+
+class Journal:
+    def __init__(self, path, max_bytes=4 * 1024 * 1024, keep=None, replay=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.replay = replay
+        self._lock_path = path + ".lock"
+        self._thread_lock = threading.Lock()
+        self._inode = None
+        self._offset = None
+        self._compact_size = max_bytes
+
+    def _flock(self, mode):
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, mode)
+        return fd
+
+    def append(self, record):
+        if "\n" in record:
+            raise ValueError("journal records can't contain newlines")
+        data = (record + "\n").encode("utf-8")
+        lock_fd = self._flock(fcntl.LOCK_SH)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, data)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        finally:
+            os.close(lock_fd)
+        if size > self._compact_size:
+            self.compact()
+
+    def compact(self):
+        lock_fd = self._flock(fcntl.LOCK_EX)
+        try:
+            try:
+                if os.path.getsize(self.path) <= self.max_bytes:
+                    return  # another worker compacted it first
+                with open(self.path, "rb") as f:
+                    lines = f.read().decode("utf-8").splitlines()
+            except FileNotFoundError:
+                return
+            kept = [line for line in lines if self.keep and self.keep(line)]
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+            data = "".join(line + "\n" for line in kept).encode("utf-8")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.path)
+            # if most records are still live, don't rewrite the file again on the next append
+            self._compact_size = max(self.max_bytes, 2 * len(data))
+        finally:
+            os.close(lock_fd)
+
+    def poll(self):
+        """
+        Return (records, reset): the records appended since the previous poll, and whether
+        the file was replaced in between (in which case records is everything it holds).
+        """
+        with self._thread_lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                if self._offset is None:
+                    self._offset = 0  # nothing written yet, so everything that comes is new
+                return [], False
+            reset = False
+            if self._offset is None:
+                self._inode = st.st_ino
+                self._offset = 0 if self.replay else st.st_size
+            elif self._inode is None:
+                self._inode = st.st_ino  # created since the first poll
+            elif st.st_ino != self._inode or st.st_size < self._offset:
+                self._inode = st.st_ino
+                self._offset = 0
+                reset = True
+            if st.st_size == self._offset:
+                return [], reset
+
+            with open(self.path, "rb") as f:
+                if os.fstat(f.fileno()).st_ino != self._inode:
+                    # swapped between stat() and open(); pick it up on the next poll
+                    return [], reset
+                f.seek(self._offset)
+                chunk = f.read()
+            end = chunk.rfind(b"\n") + 1  # leave a half-written line for later
+            self._offset += end
+            return chunk[:end].decode("utf-8").splitlines(), reset
@@ -0,0 +1,47 @@
+"""
+JSON provider for the app: encodes with orjson when it is installed ($ pipenv install orjson)
+and falls back to Flask's stdlib-based provider otherwise. Output is equivalent either way
+(keys sorted, dates/decimals/uuids through Flask's default()); orjson writes non-ASCII
+characters as UTF-8 instead of escaping them.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def _options(self):
+        # datetimes go through Flask's default() so they keep the HTTP date format
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def _encode(self, obj):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except orjson.JSONEncodeError:
+            return None  # e.g. integers beyond 64 bits: let the stdlib handle it
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        data = self._encode(obj)
+        return data.decode("utf-8") if data is not None else super().dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        if orjson is None or pretty:
+            return super().response(*args, **kwargs)
+        data = self._encode(self._prepare_response_obj(args, kwargs))
+        if data is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(data + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,224 @@
+"""
+Request metrics in the Prometheus text exposition format, served on /api/metrics.
+
+For every request (except the health check, the metrics scrape itself and event streams) we record
+latency, response size and status per endpoint, and, through SQLAlchemy engine events,
+how many SQL statements it ran and how long they took. Components with their own
+counters (revocation cache, password hasher, login limiter...) are exported as counters,
+except the stats a collector names as gauges (current sizes such as cache entries).
+
+With gunicorn each worker only sees its own requests. Set METRICS_MULTIPROC_DIR to a
+directory shared by the workers (cleared on deploy): every worker then writes its
+snapshot there at most every METRICS_FLUSH_SECONDS and /api/metrics sums all of them.
+The counts of workers that have exited stay in the sums; their gauges are left out.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import g, request, has_app_context
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+EXCLUDED_ENDPOINTS = {"api.health_check", "api.get_metrics", "api.stream_todos"}  # streams stay open for minutes
+
+
+class Registry:
+    def __init__(self, multiproc_dir=None, flush_interval=5.0):
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [buckets, counts, sum, count]
+        self._collectors = {}  # prefix -> (callable returning {stat: number}, names of the gauge stats)
+        self._next_flush = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(histogram[0]):
+                if value <= bound:
+                    histogram[1][i] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def add_collector(self, prefix, collect, gauges=()):
+        """
+        Export `collect()` stats as <prefix>_<stat>. They are monotonic counts unless
+        named in `gauges`; gauges ending in _max are merged across workers by maximum.
+        """
+        self._collectors[prefix] = (collect, frozenset(gauges))
+
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            gauges = []
+            for prefix, (collect, gauge_stats) in self._collectors.items():
+                for stat, value in collect().items():
+                    (gauges if stat in gauge_stats else counters).append([f"{prefix}_{stat}", [], value])
+            return {
+                "counters": counters,
+                "histograms": [[name, list(labels), *[list(h[0]), list(h[1]), h[2], h[3]]]
+                               for (name, labels), h in self._histograms.items()],
+                "gauges": gauges,
+            }
+
+    def flush(self, force=False):
+        """Write this worker's snapshot to the multiprocess directory (when one is configured)."""
+        if not self.multiproc_dir or (not force and time.monotonic() < self._next_flush):
+            return
+        self._next_flush = time.monotonic() + self.flush_interval
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.multiproc_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, os.path.join(self.multiproc_dir, f"metrics-{os.getpid()}.json"))
+
+    def _snapshots(self):
+        if not self.multiproc_dir:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snapshots = []
+        for filename in os.listdir(self.multiproc_dir):
+            if filename.startswith("metrics-") and filename.endswith(".json"):
+                try:
+                    with open(os.path.join(self.multiproc_dir, filename)) as f:
+                        snapshot = json.load(f)
+                except (OSError, ValueError):
+                    continue  # a worker is replacing it right now
+                if not _alive(int(filename[len("metrics-"):-len(".json")])):
+                    snapshot["gauges"] = []  # a current state that no longer exists
+                snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        counters, histograms, gauges = {}, {}, {}
+        for snapshot in self._snapshots():
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, buckets, counts, total, count in snapshot["histograms"]:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, [buckets, [0] * len(buckets), 0.0, 0])
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+                merged[3] += count
+            for name, _, value in snapshot["gauges"]:
+                # per-worker totals add up; maxima don't
+                gauges[name] = max(gauges.get(name, value), value) if name.endswith("_max") \
+                    else gauges.get(name, 0) + value
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {bucket_count}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, value in sorted(gauges.items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists, owned by someone else
+    return True
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                       for k, v in labels)
+    return "{" + escaped + "}"
+
+
+metrics = Registry(os.getenv("METRICS_MULTIPROC_DIR"), float(os.getenv("METRICS_FLUSH_SECONDS", 5)))
+
+
+def _count_bytes(chunks, counter):
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
+
+
+def setup_metrics(app, db):
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        stats = g.get("_sql_stats") if has_app_context() else None
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+
+    @app.before_request
+    def start_request_metrics():
+        g._request_started = time.perf_counter()
+        g._sql_stats = [0, 0.0]
+
+    @app.after_request
+    def record_request_metrics(response):
+        endpoint = request.endpoint or "none"
+        if endpoint in EXCLUDED_ENDPOINTS or "_request_started" not in g:
+            return response
+        started, sql_stats, method = g._request_started, g._sql_stats, request.method
+        size = [response.calculate_content_length()]
+
+        def record():
+            metrics.inc("http_requests_total", {"endpoint": endpoint, "method": method,
+                                                "status": str(response.status_code)})
+            metrics.observe("http_request_duration_seconds", {"endpoint": endpoint, "method": method},
+                            time.perf_counter() - started, LATENCY_BUCKETS)
+            metrics.observe("http_response_size_bytes", {"endpoint": endpoint}, size[0], SIZE_BUCKETS)
+            metrics.observe("db_statements_per_request", {"endpoint": endpoint}, sql_stats[0], STATEMENT_BUCKETS)
+            metrics.observe("db_time_per_request_seconds", {"endpoint": endpoint}, sql_stats[1], LATENCY_BUCKETS)
+            metrics.flush()
+
+        if size[0] is None:
+            # streamed: count the bytes as they go out and record once the body has been sent
+            size = [0]
+            body = response.response
+            response.response = _count_bytes(response.iter_encoded(), size)
+            if hasattr(body, "close"):
+                response.call_on_close(body.close)
+            response.call_on_close(record)
+        else:
+            record()
+        return response
@@ -1,14 +1,17 @@
 from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import String, Boolean, Integer, DateTime, Text
+from sqlalchemy import String, Boolean, Integer, BigInteger, DateTime, Text
 from sqlalchemy.orm import Mapped, mapped_column
-from werkzeug.security import generate_password_hash, check_password_hash
+import os
+from base64 import b64encode
+from api.passwords import passwords
 
 db = SQLAlchemy()
 
 
 class User(db.Model):
     __tablename__ = "user"
+    SERIALIZED_FIELDS = ("id", "email", "lastname", "is_active", "avatar")
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     email: Mapped[str] = mapped_column(
@@ -24,16 +27,25 @@ class User(db.Model):
         timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(
         timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+    # bumped by every todo write; see api.queries.bump_todos_version
+    todos_version: Mapped[int] = mapped_column(
+        BigInteger(), nullable=False, default=0, server_default="0")
 
+    # loaded on access only: serialize() doesn't include them
     todos: Mapped[list["Todos"]] = db.relationship(
-        "Todos", back_populates="user", cascade="all, delete-orphan", lazy="selectin")
+        "Todos", back_populates="user", cascade="all, delete-orphan", lazy="select")
 
     # helpers
     def set_password(self, plaintext: str):
-        self.password_hash = generate_password_hash(plaintext)
+        # a fresh per-user salt is appended to the password before hashing
+        self.salt = b64encode(os.urandom(32)).decode('utf-8')
+        self.password_hash = passwords.hash(plaintext + self.salt)
 
     def check_password(self, plaintext: str) -> bool:
-        return check_password_hash(self.password_hash, plaintext)
+        return passwords.verify(self.password_hash, plaintext + self.salt)
+
+    def password_needs_rehash(self) -> bool:
+        return passwords.needs_rehash(self.password_hash)
 
     def revoke_all_tokens(self):
         self.token_version = (self.token_version or 0) + 1
@@ -47,9 +59,21 @@ class User(db.Model):
             "avatar": self.avatar,
         }
 
+    @staticmethod
+    def serialize_row(row, fields=SERIALIZED_FIELDS) -> dict:
+        # same output as serialize(), straight from a column query row
+        return dict(zip(fields, row))
+
 
 class Todos(db.Model):
     __tablename__ = "todos"
+    SERIALIZED_FIELDS = ("id", "label", "is_done", "user_id")
+    # (user_id, id) serves the per-user listing and its id keyset cursor in id order;
+    # (user_id, is_done, id) does the same for the is_done filter
+    __table_args__ = (
+        db.Index("ix_todos_user_id_id", "user_id", "id"),
+        db.Index("ix_todos_user_id_is_done_id", "user_id", "is_done", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     label: Mapped[str] = mapped_column(String(255), nullable=False)
@@ -61,10 +85,11 @@ class Todos(db.Model):
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(
         timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
     user_id: Mapped[int] = mapped_column(
-        db.ForeignKey("user.id"), nullable=False, index=True)
+        db.ForeignKey("user.id"), nullable=False)
 
+    # loaded on access only: the todo endpoints never need the owner row
     user: Mapped["User"] = db.relationship(
-        "User", back_populates="todos", lazy="joined")
+        "User", back_populates="todos", lazy="select")
 
     def serialize(self) -> dict:
         return {
@@ -74,6 +99,27 @@ class Todos(db.Model):
             "user_id": self.user_id,
         }
 
+    @staticmethod
+    def serialize_row(row, fields=SERIALIZED_FIELDS) -> dict:
+        # same output as serialize(), straight from a column query row
+        return dict(zip(fields, row))
+
+
+class TodoTombstone(db.Model):
+    """A deleted todo, so GET /api/todos?since= can report deletions without listing every id."""
+    __tablename__ = "todo_tombstone"
+    __table_args__ = (
+        db.Index("ix_todo_tombstone_user_id_deleted_at", "user_id", "deleted_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    todo_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    # version_datetime() of the todo-list version that deleted it
+    deleted_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False)
+
 
 class RevokedToken(db.Model):
     __tablename__ = "revoked_token"
@@ -0,0 +1,93 @@
+"""
+Password hashing service.
+
+Hashes run on the request thread, but at most PASSWORD_HASH_WORKERS of them at once
+per process, and at most PASSWORD_HASH_MAX_PENDING can be running or waiting for their
+turn; beyond that requests fail fast with a 503 instead of piling up behind each other.
+The time spent waiting is reported as queue time in the stats. (hashlib's scrypt and
+pbkdf2 release the GIL, so with threaded workers the other requests keep being served
+while a hash runs either way.)
+
+    PASSWORD_HASH_METHOD       werkzeug method string, e.g. "scrypt" or "pbkdf2:sha256:600000"
+    PASSWORD_HASH_WORKERS      hashes computed at once (default: number of CPUs)
+    PASSWORD_HASH_MAX_PENDING  hashes allowed to be running or queued (default: 4 x workers)
+"""
+import os
+import threading
+import time
+from werkzeug.security import generate_password_hash, check_password_hash
+from api.utils import APIException
+
+
+class PasswordHashBusy(APIException):
+    status_code = 503
+    headers = {"Retry-After": "1"}
+
+
+class PasswordHasher:
+    def __init__(self, method="scrypt", workers=None, max_pending=None):
+        self.method = method
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 4 * self.workers
+        self._running = threading.BoundedSemaphore(self.workers)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._stats_lock = threading.Lock()
+        self._prefix = None
+        self.stats = {
+            "hashed": 0, "verified": 0, "outdated": 0, "rejected": 0,
+            "queue_seconds_total": 0.0, "queue_seconds_max": 0.0, "hash_seconds_total": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            method=os.getenv("PASSWORD_HASH_METHOD", "scrypt"),
+            workers=int(os.getenv("PASSWORD_HASH_WORKERS", 0)) or None,
+            max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", 0)) or None,
+        )
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.stats["rejected"] += 1
+            raise PasswordHashBusy("Server busy, try again shortly", payload={"retry_after": 1})
+        submitted = time.perf_counter()
+        try:
+            with self._running:
+                started = time.perf_counter()
+                result = fn(*args)
+            queued, took = started - submitted, time.perf_counter() - started
+        finally:
+            self._slots.release()
+        with self._stats_lock:
+            self.stats["queue_seconds_total"] += queued
+            self.stats["queue_seconds_max"] = max(self.stats["queue_seconds_max"], queued)
+            self.stats["hash_seconds_total"] += took
+        return result
+
+    def hash(self, plaintext):
+        pwhash = self._run(generate_password_hash, plaintext, self.method)
+        with self._stats_lock:
+            self.stats["hashed"] += 1
+            self._prefix = pwhash.split("$", 1)[0]
+        return pwhash
+
+    def verify(self, pwhash, plaintext):
+        result = self._run(check_password_hash, pwhash, plaintext)
+        with self._stats_lock:
+            self.stats["verified"] += 1
+        return result
+
+    def needs_rehash(self, pwhash):
+        """True when `pwhash` was made with a different method or cost than the configured one."""
+        if self._prefix is None:
+            # werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"); learn the full form once
+            self._prefix = generate_password_hash("", self.method).split("$", 1)[0]
+        if pwhash.split("$", 1)[0] == self._prefix:
+            return False
+        with self._stats_lock:
+            self.stats["outdated"] += 1
+        return True
+
+
+passwords = PasswordHasher.from_env()
@@ -0,0 +1,146 @@
+"""
+Query profiling for development, tests and staging (QUERY_PROFILING=1).
+
+Every SQL statement a request runs is counted and reduced to its "shape" (whitespace
+collapsed, IN lists and literals folded). A shape executed QUERY_PROFILING_REPEAT times
+or more in one request is reported as a likely N+1, and statements slower than
+QUERY_PROFILING_SLOW_MS as slow. The findings go to the X-Query-* response headers and
+to the log.
+
+For tests there is a `query_budget` fixture; load it with `-p api.profiling`
+(or `pytest_plugins = ["api.profiling"]` in conftest.py):
+
+    def test_list_todos(client, query_budget):
+        with query_budget(2):
+            client.get("/api/todos", headers=auth)
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from flask import g, request, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"\(\s*(?:\$?\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\$?\?|%\(\w+\)s|:\w+))*\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    shape = _SPACE.sub(" ", statement).strip()
+    shape = _LITERAL.sub("?", shape)
+    return _IN_LIST.sub("(?)", shape)
+
+
+class QueryLog:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.timings = []  # (seconds, shape)
+
+    def record(self, statement, seconds):
+        shape = statement_shape(statement)
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[shape] += 1
+        self.timings.append((seconds, shape))
+
+    def repeated(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def slow(self, threshold_seconds):
+        return sorted((t for t in self.timings if t[0] >= threshold_seconds), reverse=True)
+
+    def summary(self):
+        lines = [f"{self.count} statements in {self.seconds * 1000:.1f} ms"]
+        lines += [f"  {count}x {shape}" for shape, count in self.shapes.most_common()]
+        return "\n".join(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["profiling_started"].pop()
+    for log in _active_logs:
+        log.record(statement, seconds)
+    request_log = g.get("_query_log") if has_app_context() else None
+    if request_log is not None:
+        request_log.record(statement, seconds)
+
+
+_active_logs = []  # QueryLogs collecting every statement (query_budget)
+_listening = False
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        _listening = True
+
+
+@contextmanager
+def capture_queries():
+    """Collect every statement executed inside the block into a QueryLog."""
+    _listen()
+    log = QueryLog()
+    _active_logs.append(log)
+    try:
+        yield log
+    finally:
+        _active_logs.remove(log)
+
+
+def setup_profiling(app):
+    if os.getenv("QUERY_PROFILING") != "1":
+        return
+    slow = float(os.getenv("QUERY_PROFILING_SLOW_MS", 100)) / 1000
+    repeat = int(os.getenv("QUERY_PROFILING_REPEAT", 5))
+    _listen()
+
+    @app.before_request
+    def start_query_log():
+        g._query_log = QueryLog()
+
+    @app.after_request
+    def report_queries(response):
+        log = g.pop("_query_log", None)
+        if log is None:
+            return response
+        repeated, slow_queries = log.repeated(repeat), log.slow(slow)
+        response.headers["X-Query-Count"] = str(log.count)
+        response.headers["X-Query-Time-Ms"] = f"{log.seconds * 1000:.1f}"
+        if repeated or slow_queries:
+            response.headers["X-Query-Report"] = f"repeated={len(repeated)}; slow={len(slow_queries)}"
+            for shape, count in repeated:
+                logger.warning("possible N+1 on %s %s: %dx %s", request.method, request.path, count, shape)
+            for seconds, shape in slow_queries:
+                logger.warning("slow query on %s %s (%.1f ms): %s", request.method, request.path, seconds * 1000, shape)
+        return response
+
+
+try:
+    import pytest
+except ImportError:  # only needed for the fixture
+    pytest = None
+
+if pytest is not None:
+    @pytest.fixture
+    def query_budget():
+        """`with query_budget(n):` fails the test when the block runs more than n SQL statements."""
+        @contextmanager
+        def budget(max_statements):
+            with capture_queries() as log:
+                yield log
+            if log.count > max_statements:
+                pytest.fail(f"query budget exceeded: {log.count} > {max_statements}\n{log.summary()}")
+        return budget
@@ -0,0 +1,159 @@
+"""
+Column-level queries and statements for the todo endpoints. They return lightweight
+Row tuples instead of ORM instances, so no identity map bookkeeping or relationship
+loading happens on the hot paths.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from api.models import db, User, Todos, TodoTombstone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+TODO_FIELDS = Todos.SERIALIZED_FIELDS
+USER_FIELDS = User.SERIALIZED_FIELDS
+
+# session.info key: ids of the users whose todo list the open transaction changed (see api.cache)
+CHANGED_TODO_LISTS = "changed_todo_lists"
+
+# deletions are reported to ?since= for this long (TODO_TOMBSTONE_RETENTION_DAYS)
+TOMBSTONE_RETENTION = timedelta(days=float(os.getenv("TODO_TOMBSTONE_RETENTION_DAYS", 30)))
+
+
+def todo_columns(fields=TODO_FIELDS):
+    return [getattr(Todos, field) for field in fields]
+
+
+def version_datetime(version):
+    """The updated_at stamp written together with a todo-list version."""
+    return EPOCH + timedelta(microseconds=version)
+
+
+def tombstone_horizon():
+    """The oldest todo-list version whose deletions are all still recorded."""
+    return (datetime.now(timezone.utc) - TOMBSTONE_RETENTION - EPOCH) // timedelta(microseconds=1)
+
+
+def todos_version(user_id):
+    """The user's current todo-list version (a primary key lookup on user, todos isn't touched)."""
+    return db.session.execute(
+        db.select(User.todos_version).where(User.id == user_id)).scalar()
+
+
+def bump_todos_version(user_id):
+    """
+    Advance the user's todo-list version inside the current transaction and return it.
+
+    Versions are microsecond timestamps, forced to be strictly increasing, and the
+    rows written in the same transaction get version_datetime(version) as their
+    updated_at, so "changed after version N" is simply updated_at > version_datetime(N).
+    The UPDATE also locks the user row, which orders concurrent writers on Postgres.
+    """
+    now = int(time.time() * 1_000_000)
+    statement = db.update(User).where(User.id == user_id).values(
+        todos_version=db.case((User.todos_version >= now, User.todos_version + 1), else_=now),
+        updated_at=User.updated_at,  # the profile itself didn't change
+    ).returning(User.todos_version)
+    version = db.session.execute(statement, execution_options={"synchronize_session": False}).scalar_one()
+    db.session.info.setdefault(CHANGED_TODO_LISTS, set()).add(int(user_id))
+    return version
+
+
+def select_todos(user_id, fields=TODO_FIELDS, is_done=None, after=None, limit=None, since=None):
+    """
+    Rows of (id, *fields) for the user's todos ordered by id, walking the
+    (user_id, id) index, or (user_id, is_done, id) when filtered by is_done.
+    `after` is an id cursor; `since` a todo-list version, keeping only the rows
+    written after it.
+    """
+    query = db.select(Todos.id, *todo_columns(fields)).where(
+        Todos.user_id == user_id).order_by(Todos.id)
+    if is_done is not None:
+        query = query.where(Todos.is_done == is_done)
+    if since is not None:
+        query = query.where(Todos.updated_at > version_datetime(since))
+    if after is not None:
+        query = query.where(Todos.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return db.session.execute(query).all()
+
+
+def iter_users(after=None, limit=None, batch_size=1000):
+    """
+    Rows of the serialized User columns ordered by id. Rows are fetched from the
+    cursor `batch_size` at a time, so the full table is never held in memory.
+    """
+    query = db.select(*[getattr(User, field) for field in USER_FIELDS]).order_by(User.id)
+    if after is not None:
+        query = query.where(User.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return db.session.execute(query.execution_options(yield_per=batch_size))
+
+
+def iter_todos(user_id, fields=TODO_FIELDS, batch_size=1000):
+    """Like select_todos() for the whole list, fetched from the cursor `batch_size` rows at a time."""
+    query = db.select(Todos.id, *todo_columns(fields)).where(
+        Todos.user_id == user_id).order_by(Todos.id)
+    return db.session.execute(query.execution_options(yield_per=batch_size))
+
+
+def find_todo(user_id, todo_id):
+    """The row of one of the user's todos, or None."""
+    query = db.select(*todo_columns()).where(
+        Todos.id == todo_id, Todos.user_id == user_id)
+    return db.session.execute(query).one_or_none()
+
+
+def insert_todos(user_id, labels, version):
+    """Insert one todo per label in a single executemany; rows come back in the order of `labels`."""
+    if not labels:
+        return []
+    stamp = version_datetime(version)
+    statement = db.insert(Todos).returning(
+        *todo_columns(), sort_by_parameter_order=True)
+    return db.session.execute(statement, [
+        {"label": label, "is_done": False, "user_id": user_id, "created_at": stamp, "updated_at": stamp}
+        for label in labels]).all()
+
+
+def append_todos(user_id, todos, version):
+    """Insert (label, is_done) pairs with one executemany, without reading anything back."""
+    stamp = version_datetime(version)
+    db.session.execute(db.insert(Todos), [
+        {"label": label, "is_done": is_done, "user_id": user_id, "created_at": stamp, "updated_at": stamp}
+        for label, is_done in todos])
+
+
+def update_todos(user_id, ids, values, version):
+    """Apply `values` to the user's todos in `ids` with one UPDATE; returns the updated rows."""
+    statement = db.update(Todos).where(Todos.id.in_(ids), Todos.user_id == user_id).values(
+        updated_at=version_datetime(version), **values).returning(*todo_columns())
+    return db.session.execute(statement, execution_options={"synchronize_session": False}).all()
+
+
+def delete_todos(user_id, ids, version):
+    """
+    Delete the user's todos in `ids` with one DELETE and record them as tombstones at
+    `version`; returns the ids that existed. The user's expired tombstones go too.
+    """
+    statement = db.delete(Todos).where(
+        Todos.id.in_(ids), Todos.user_id == user_id).returning(Todos.id)
+    deleted = db.session.execute(statement, execution_options={"synchronize_session": False}).scalars().all()
+    if deleted:
+        db.session.execute(db.delete(TodoTombstone).where(
+            TodoTombstone.user_id == user_id,
+            TodoTombstone.deleted_at < version_datetime(tombstone_horizon())))
+        stamp = version_datetime(version)
+        db.session.execute(db.insert(TodoTombstone), [
+            {"todo_id": todo_id, "user_id": user_id, "deleted_at": stamp} for todo_id in deleted])
+    return deleted
+
+
+def deleted_todo_ids(user_id, since):
+    """Ids of the user's todos deleted after version `since` (an index range on the tombstones)."""
+    query = db.select(TodoTombstone.todo_id).where(
+        TodoTombstone.user_id == user_id,
+        TodoTombstone.deleted_at > version_datetime(since)).order_by(TodoTombstone.todo_id).distinct()
+    return db.session.execute(query).scalars().all()
@@ -0,0 +1,192 @@
+"""
+Throttling for /login.
+
+Every attempt takes a token from two buckets, one keyed by client IP and one by the
+normalized email, so a credential-stuffing burst is turned away before it costs a
+database lookup or a password hash. Buckets live in process memory by default, or in a
+SQLite file shared by all gunicorn workers of the host (LOGIN_RATE_LIMIT_STORE).
+
+Emails that don't belong to any user are remembered for a short time (negative cache),
+so repeated attempts against them skip the user lookup. /register broadcasts the new
+email through a journal so no worker keeps answering "unknown" for it.
+
+    LOGIN_RATE_IP_PER_MINUTE / LOGIN_RATE_IP_BURST        default 30 / 10 (0 disables)
+    LOGIN_RATE_EMAIL_PER_MINUTE / LOGIN_RATE_EMAIL_BURST  default 10 / 5 (0 disables)
+    LOGIN_RATE_LIMIT_STORE        path of the shared SQLite bucket file (optional)
+    LOGIN_RATE_TRUSTED_PROXIES    proxies in front of the app that append X-Forwarded-For (default 0;
+                                  1 behind the Render/Heroku router, or every client shares one IP bucket)
+    LOGIN_NEGATIVE_CACHE_SECONDS  how long unknown emails are remembered (default 30, 0 disables)
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from api.journal import Journal
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        """Take a token; returns 0 when allowed, otherwise the seconds until one is available."""
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)  # an evicted key just starts with a full bucket
+        return 0 if allowed else (1 - tokens) / rate
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file, so every worker on the host draws from the same ones."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                         (key, tokens - 1 if allowed else tokens, now))
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                # buckets idle for an hour are full again anyway
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - 3600,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return 0 if allowed else (1 - tokens) / rate
+
+
+def _email_key(email):
+    return hashlib.sha1(email.encode("utf-8")).hexdigest()
+
+
+class LoginLimiter:
+    def __init__(self, store, ip_rate=30, ip_burst=10, email_rate=10, email_burst=5,
+                 negative_ttl=30.0, negative_size=50_000, trusted_proxies=0):
+        self.store = store
+        self.ip_rate = ip_rate / 60.0
+        self.ip_burst = ip_burst
+        self.email_rate = email_rate / 60.0
+        self.email_burst = email_burst
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self.trusted_proxies = trusted_proxies
+        self._unknown = OrderedDict()  # email key -> expires (monotonic)
+        self._lock = threading.Lock()
+        self._journal = None
+        self.stats = {"allowed": 0, "rejected_ip": 0, "rejected_email": 0,
+                      "negative_hits": 0, "negative_misses": 0}
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("LOGIN_RATE_LIMIT_STORE")
+        return cls(
+            SQLiteBucketStore(path) if path else MemoryBucketStore(),
+            ip_rate=float(os.getenv("LOGIN_RATE_IP_PER_MINUTE", 30)),
+            ip_burst=float(os.getenv("LOGIN_RATE_IP_BURST", 10)),
+            email_rate=float(os.getenv("LOGIN_RATE_EMAIL_PER_MINUTE", 10)),
+            email_burst=float(os.getenv("LOGIN_RATE_EMAIL_BURST", 5)),
+            negative_ttl=float(os.getenv("LOGIN_NEGATIVE_CACHE_SECONDS", 30)),
+            trusted_proxies=int(os.getenv("LOGIN_RATE_TRUSTED_PROXIES", 0)),
+        )
+
+    def use_journal(self, path):
+        """Share "this email now exists" notices with the other workers through `path`."""
+        self._journal = Journal(path, replay=False)
+
+    def client_ip(self, request):
+        if self.trusted_proxies and len(request.access_route) >= self.trusted_proxies:
+            # the entry appended by the outermost proxy we trust; anything before it is client-supplied
+            return request.access_route[-self.trusted_proxies]
+        return request.remote_addr or ""
+
+    def check(self, ip, email):
+        """Returns 0 when the attempt may go ahead, otherwise the seconds to wait (for Retry-After)."""
+        now = time.time()
+        if self.ip_rate:
+            wait = self.store.take("ip:" + ip, self.ip_rate, self.ip_burst, now)
+            if wait:
+                self._count("rejected_ip")
+                return math.ceil(wait)
+        if self.email_rate:
+            wait = self.store.take("email:" + _email_key(email), self.email_rate, self.email_burst, now)
+            if wait:
+                self._count("rejected_email")
+                return math.ceil(wait)
+        self._count("allowed")
+        return 0
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _apply_journal(self):
+        records, reset = self._journal.poll()
+        with self._lock:
+            if reset:
+                self._unknown.clear()  # records may have been missed
+            for key in records:
+                self._unknown.pop(key, None)
+
+    def is_unknown(self, email):
+        if not self.negative_ttl:
+            return False
+        if self._journal is not None:
+            self._apply_journal()
+        key = _email_key(email)
+        with self._lock:
+            expires = self._unknown.get(key)
+            if expires is not None and expires > time.monotonic():
+                self.stats["negative_hits"] += 1
+                return True
+            self._unknown.pop(key, None)
+            self.stats["negative_misses"] += 1
+            return False
+
+    def remember_unknown(self, email):
+        if not self.negative_ttl:
+            return
+        with self._lock:
+            self._unknown[_email_key(email)] = time.monotonic() + self.negative_ttl
+            self._unknown.move_to_end(_email_key(email))
+            while len(self._unknown) > self.negative_size:
+                self._unknown.popitem(last=False)
+
+    def forget_unknown(self, email):
+        key = _email_key(email)
+        with self._lock:
+            self._unknown.pop(key, None)
+        if self._journal is not None:
+            self._journal.append(key)
+
+
+login_limiter = LoginLimiter.from_env()
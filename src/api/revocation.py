@@ -0,0 +1,249 @@
+"""
+In-process cache of revoked JWT ids (jti) sitting in front of the revoked_token table.
+
+A bloom filter built from the table answers "not revoked" for the vast majority of
+requests without a database round trip; only a possible positive is confirmed
+against the table, and confirmed jtis are kept in a small LRU until their token expires.
+
+Revocations made by other gunicorn workers reach this one through a shared journal
+file (see api.journal), polled before every check, so a logged-out token is rejected
+everywhere as soon as /logout returns. The periodic table sync remains as a safety net
+for revocations written by other hosts or by hand.
+"""
+import hashlib
+import logging
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from sqlalchemy import func, select, delete
+from api.models import db, RevokedToken
+from api.journal import Journal
+
+logger = logging.getLogger(__name__)
+
+# rows committed out of id order (concurrent logouts on Postgres) are picked up
+# by re-reading this many ids below the highest one already seen
+SYNC_ID_OVERLAP = 256
+
+
+def to_timestamp(value):
+    # SQLite hands back naive datetimes even for timezone=True columns; they are stored as UTC
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+def _unexpired_record(record):
+    return float(record.partition(" ")[2]) > time.time()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(int(capacity), 1)
+        self.size = int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationCache:
+    def __init__(self, capacity=100_000, error_rate=0.001, lru_size=10_000,
+                 sync_interval=5.0, rebuild_interval=3600.0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lru_size = lru_size
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._confirmed = OrderedDict()  # jti -> expires_at timestamp
+        self._last_id = 0
+        self._next_sync = 0.0
+        self._next_rebuild = 0.0
+        self._journal = None
+        self._journal_poll_interval = 0.0
+        self._next_journal_poll = 0.0
+        self.stats = {"checks": 0, "db_lookups": 0, "false_positives": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            capacity=int(os.getenv("REVOCATION_BLOOM_CAPACITY", 100_000)),
+            error_rate=float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", 0.001)),
+            lru_size=int(os.getenv("REVOCATION_LRU_SIZE", 10_000)),
+            sync_interval=float(os.getenv("REVOCATION_SYNC_SECONDS", 5)),
+        )
+
+    def use_journal(self, path, poll_interval=0.0):
+        """Broadcast revocations through the journal file at `path` (0 = poll on every check)."""
+        self._journal = Journal(path, keep=_unexpired_record)
+        self._journal_poll_interval = poll_interval
+
+    def _poll_journal(self):
+        if self._journal_poll_interval:
+            now = time.monotonic()
+            if now < self._next_journal_poll:
+                return
+            self._next_journal_poll = now + self._journal_poll_interval
+        records, _ = self._journal.poll()
+        if not records:
+            return
+        now = time.time()
+        with self._lock:
+            for record in records:
+                jti, _, expires_at = record.partition(" ")
+                if jti not in self._bloom:
+                    self._bloom.add(jti)
+                # journal records are only written after the row is committed
+                self._remember(jti, float(expires_at), now)
+
+    def _rebuild(self, now):
+        # full reload: expired jtis can't be removed from a bloom filter, so it is rebuilt periodically
+        rows = db.session.query(RevokedToken.jti, RevokedToken.expires_at).filter(
+            RevokedToken.expires_at > datetime.fromtimestamp(now, tz=timezone.utc)).all()
+        last_id = db.session.query(func.max(RevokedToken.id)).scalar() or 0
+        bloom = BloomFilter(max(self.capacity, 2 * len(rows)), self.error_rate)
+        for jti, _ in rows:
+            bloom.add(jti)
+        with self._lock:
+            self._bloom = bloom
+            self._last_id = last_id
+            self._next_rebuild = now + self.rebuild_interval
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def _sync(self):
+        # pick up jtis revoked by other processes since the last sync
+        rows = db.session.query(RevokedToken.id, RevokedToken.jti).filter(
+            RevokedToken.id > self._last_id - SYNC_ID_OVERLAP).all()
+        with self._lock:
+            for row_id, jti in rows:
+                if jti not in self._bloom:
+                    self._bloom.add(jti)
+                self._last_id = max(self._last_id, row_id)
+            self._next_sync = time.monotonic() + self.sync_interval
+
+    def refresh(self, force=False):
+        now = time.time()
+        if force or self._bloom is None or now >= self._next_rebuild \
+                or self._bloom.count > self._bloom.capacity:
+            self._rebuild(now)
+        elif time.monotonic() >= self._next_sync:
+            self._sync()
+        if self._journal is not None:
+            self._poll_journal()
+
+    def _remember(self, jti, expires_at, now):
+        confirmed = self._confirmed
+        confirmed[jti] = expires_at
+        confirmed.move_to_end(jti)
+        # evict by expiry first, then by recency
+        if len(confirmed) > self.lru_size:
+            for key in [k for k, exp in confirmed.items() if exp <= now]:
+                del confirmed[key]
+        while len(confirmed) > self.lru_size:
+            confirmed.popitem(last=False)
+
+    def add(self, jti, expires_at):
+        """Record a jti revoked by this process (called after the revoked_token row is committed)."""
+        if self._journal is not None:
+            self._journal.append(f"{jti} {to_timestamp(expires_at):.0f}")
+        with self._lock:
+            if self._bloom is None:
+                return  # the first check will load it from the table
+            self._bloom.add(jti)
+            self._remember(jti, to_timestamp(expires_at), time.time())
+
+    def is_revoked(self, jti):
+        self.refresh()
+        now = time.time()
+        with self._lock:
+            self.stats["checks"] += 1
+            if jti not in self._bloom:
+                return False
+            expires_at = self._confirmed.get(jti)
+            if expires_at is not None:
+                if expires_at > now:
+                    self._confirmed.move_to_end(jti)
+                else:
+                    del self._confirmed[jti]
+                return True
+            self.stats["db_lookups"] += 1
+
+        # possible positive: confirm against the table
+        expires_at = db.session.query(RevokedToken.expires_at).filter_by(
+            jti=jti).scalar()
+        with self._lock:
+            if expires_at is None:
+                self.stats["false_positives"] += 1
+                return False
+            self._remember(jti, to_timestamp(expires_at), now)
+        return True
+
+
+def purge_expired_tokens(batch_size=1000, pause=0.0):
+    """
+    Delete expired revoked_token rows in batches of `batch_size`, committing after each one
+    so no lock is held for long (SQLite locks the whole file while writing).
+    Returns (rows deleted, seconds elapsed).
+    """
+    cutoff = datetime.now(timezone.utc)
+    started = time.monotonic()
+    total = 0
+    while True:
+        batch = select(RevokedToken.id).where(
+            RevokedToken.expires_at < cutoff).order_by(RevokedToken.expires_at).limit(batch_size)
+        result = db.session.execute(
+            delete(RevokedToken).where(RevokedToken.id.in_(batch)),
+            execution_options={"synchronize_session": False})
+        db.session.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return total, time.monotonic() - started
+
+
+def start_purge_scheduler(app, interval, batch_size=1000, pause=0.0):
+    """Run purge_expired_tokens every `interval` seconds on a daemon thread."""
+    def run():
+        while True:
+            # jitter so several gunicorn workers don't purge in lockstep
+            time.sleep(interval * random.uniform(0.9, 1.1))
+            try:
+                with app.app_context():
+                    deleted, elapsed = purge_expired_tokens(batch_size, pause)
+                if deleted:
+                    logger.info("purged %d expired revoked tokens in %.2fs (%.0f rows/sec)",
+                                deleted, elapsed, deleted / elapsed if elapsed else deleted)
+            except Exception:
+                logger.exception("revoked token purge failed")
+
+    thread = threading.Thread(target=run, name="revoked-token-purge", daemon=True)
+    thread.start()
+    logger.info("purging expired revoked tokens every %ss in batches of %d", interval, batch_size)
+    return thread
+
+
+revoked_tokens = RevocationCache.from_env()
@@ -1,13 +1,22 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
-from flask import Flask, request, jsonify, url_for, Blueprint
+from flask import Flask, request, jsonify, url_for, Blueprint, Response, stream_with_context, current_app
 from api.models import db, User, RevokedToken, Todos
-from api.utils import generate_sitemap, APIException
+from api.utils import generate_sitemap, APIException, stream_json_array
+from api.revocation import revoked_tokens
+from api.ratelimit import login_limiter
+from api.metrics import metrics
+from api.cache import user_cache, me_key, todos_key
+from api.events import todo_events
+from api.queries import (TODO_FIELDS, select_todos, iter_users, iter_todos,
+                         find_todo, insert_todos, append_todos, update_todos, delete_todos,
+                         deleted_todo_ids, tombstone_horizon, todos_version, bump_todos_version)
+from api.transfer import FORMATS, CONTENT_TYPES, export_chunks, parse_import
+from api.search import query_words, search_todo_labels
+from api.passwords import PasswordHashBusy
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
-from base64 import b64encode
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from datetime import timedelta, datetime, timezone
 from sqlalchemy.exc import IntegrityError
@@ -17,12 +26,60 @@ api = Blueprint('api', __name__)
 # Allow CORS requests to this API
 CORS(api)
 
+MAX_TODOS_PAGE = 1000
+MAX_USERS_PAGE = 1000
+MAX_BATCH_OPERATIONS = 1000
+MAX_SEARCH_PAGE = 100
+MAX_SEARCH_OFFSET = 10_000
+IMPORT_CHUNK_SIZE = 1000
+MAX_IMPORT_ERRORS = 100
+
+
+def parse_bool(value):
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("0", "false", "no"):
+        return False
+    raise APIException(f"Invalid boolean value '{value}'", status_code=400)
+
+
+def parse_int(name, minimum=0, maximum=None):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException(f"'{name}' must be an integer", status_code=400)
+    if value < minimum or (maximum is not None and value > maximum):
+        raise APIException(f"'{name}' is out of range", status_code=400)
+    return value
+
+
+def parse_fields(allowed):
+    fields = request.args.get("fields")
+    if not fields:
+        return allowed
+    fields = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise APIException(f"Unknown fields: {', '.join(unknown)}", status_code=400)
+    return fields
+
 
 @api.route('/health-check', methods=['GET'])
 def health_check():
     return jsonify({"status": "OK"}), 200
 
 
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), status=200, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @api.route('/register', methods=['POST'])
 def register_user():
     data = request.get_json()
@@ -42,21 +99,18 @@ def register_user():
     if User.query.filter_by(email=data["email"]).first():
         return jsonify({"message": "User already exists"}), 409
 
-    salt = b64encode(os.urandom(32)).decode('utf-8')
-    password = generate_password_hash(data["password"] + salt)
-
     new_user = User(
         email=data["email"],
-        password_hash=password,
         lastname=data["lastname"],
         avatar=data["avatar"],
-        is_active=data["is_active"],
-        salt=salt
+        is_active=data["is_active"]
     )
+    new_user.set_password(data["password"])
     db.session.add(new_user)
 
     try:
         db.session.commit()
+        login_limiter.forget_unknown(new_user.email)
         return jsonify({"message": "User created successfully"}), 201
     except Exception as e:
         db.session.rollback()
@@ -73,14 +127,33 @@ def login_user():
     if not email or not password:
         return jsonify({"message": "Email and password are required"}), 400
 
+    retry_after = login_limiter.check(login_limiter.client_ip(request), email)
+    if retry_after:
+        return jsonify({"message": "Too many login attempts, try again later"}), 429, {"Retry-After": str(retry_after)}
+
+    if login_limiter.is_unknown(email):
+        return jsonify({"message": "Invalid credentials"}), 404
+
     user = User.query.filter_by(email=email).one_or_none()
 
     if not user:
+        login_limiter.remember_unknown(email)
         return jsonify({"message": "Invalid credentials"}), 404
 
-    if not check_password_hash(user.password_hash, password + user.salt):
+    if not user.check_password(password):
         return jsonify({"message": "Invalid credentials"}), 401
 
+    # upgrade hashes made with an older method or cost while we have the plaintext
+    # (best effort: when the hasher is busy the login goes ahead with the old hash)
+    if user.password_needs_rehash():
+        try:
+            user.set_password(password)
+            db.session.commit()
+        except PasswordHashBusy:
+            pass
+        except Exception:
+            db.session.rollback()
+
     jti = os.urandom(16).hex()
     expires = timedelta(days=1)
     token = create_access_token(
@@ -103,9 +176,25 @@ def protected():
 
 @api.route('/user', methods=['GET'])
 def get_users():
-    users = User.query.all()
-
-    return jsonify([user.serialize() for user in users]), 200
+    """
+    Streams the users as a JSON array. With ?limit= it returns one page and the
+    id to pass as ?after= for the next one in the X-Next-Cursor header.
+    """
+    limit = parse_int("limit", minimum=1, maximum=MAX_USERS_PAGE)
+    after = parse_int("after")
+
+    headers = {}
+    rows = iter_users(after=after, limit=limit + 1 if limit is not None else None)
+    if limit is not None:
+        # a page is bounded, so it can be read up front to find the next cursor
+        rows = rows.all()
+        if len(rows) > limit:
+            headers["X-Next-Cursor"] = str(rows[limit - 1].id)
+            rows = rows[:limit]
+
+    users = (User.serialize_row(row) for row in rows)
+    return Response(stream_with_context(stream_json_array(users)),
+                    status=200, mimetype="application/json", headers=headers)
 
 
 @api.route('/logout', methods=['POST'])
@@ -136,6 +225,7 @@ def logout():
         db.session.rollback()
         return jsonify({"message": "Error revocando token", "error": str(e)}), 500
 
+    revoked_tokens.add(jti, expires_at)
     return jsonify({"message": "Token revocado"}), 200
 
 
@@ -143,23 +233,165 @@ def logout():
 @jwt_required()
 def get_current_user():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    cached = user_cache.get(me_key(current_user_id)) if user_cache.enabled else None
+    if cached:
+        return Response(cached[0], status=200, mimetype="application/json")
+
+    token = user_cache.token()
+    user = db.session.get(User, int(current_user_id))
     if not user:
         return jsonify({"message": "User not found"}), 404
-    return jsonify(user.serialize()), 200
+    response = jsonify(user.serialize())
+    if user_cache.enabled:
+        user_cache.set(me_key(current_user_id), response.get_data(), "", token)
+    return response, 200
+
+
+def todos_etag(user_id, version):
+    # every user starts at version 0, so the tag has to name the user as well
+    return f"{int(user_id)}-{version}"
+
+
+def private_todos_response(response, etag):
+    # a browser shared by several accounts must not answer one user's list from another's
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Authorization")
+    return response
 
 
 @api.route('/todos', methods=['GET'])
 @jwt_required()
 def get_todos():
+    """
+    Lists the user's todos ordered by id.
+    Optional query params: limit (page size), after (id cursor from next_cursor),
+    is_done (true/false) and fields (comma separated subset of the todo keys).
+
+    The response carries the user id and todo-list version as its ETag, so a matching
+    If-None-Match gets a 304 without reading the todos table. ?since=<version>
+    returns only the todos written after that version, plus in "deleted" the ids
+    of the todos deleted since then (or, with is_done, that left the filter). When
+    `since` is older than the recorded deletions, the whole list comes back with
+    "reset": true and replaces the client's copy.
+    """
     current_user_id = get_jwt_identity()
-    todos = Todos.query.filter_by(user_id=current_user_id).all()
+    limit = parse_int("limit", minimum=1, maximum=MAX_TODOS_PAGE)
+    after = parse_int("after")
+    since = parse_int("since")
+    is_done = parse_bool(request.args.get("is_done"))
+    fields = parse_fields(TODO_FIELDS)
+    if since is not None and (limit is not None or after is not None):
+        raise APIException("'since' can't be combined with 'limit' or 'after'", status_code=400)
+
+    # the plain full list is what every page load asks for, so it is cached
+    cacheable = user_cache.enabled and not request.args
+    cached = user_cache.get(todos_key(current_user_id)) if cacheable else None
+    if cached:
+        body, etag = cached
+        response = Response(status=304) if request.if_none_match.contains_weak(etag) \
+            else Response(body, status=200, mimetype="application/json")
+        return private_todos_response(response, etag)
+
+    token = user_cache.token()
+    version = todos_version(current_user_id)
+    if version is None:
+        return jsonify({"message": "User not found"}), 404
+    etag = todos_etag(current_user_id, version)
+    if request.if_none_match.contains_weak(etag):
+        return private_todos_response(Response(status=304), etag)
+
+    reset = since is not None and since < tombstone_horizon()
+    if reset:
+        since = None
+    # one extra row tells whether there is a next page
+    rows = select_todos(current_user_id, fields, is_done=is_done, after=after, since=since,
+                        limit=limit + 1 if limit is not None else None)
+
     todos = {
-        "todos": [todo.serialize() for todo in todos],
-        "user_id": current_user_id
+        "todos": [Todos.serialize_row(row[1:], fields) for row in rows[:limit]],
+        "user_id": current_user_id,
+        "version": version
     }
+    if limit is not None:
+        todos["next_cursor"] = rows[limit - 1][0] if len(rows) > limit else None
+    if reset:
+        todos["reset"] = True
+    elif since is not None:
+        removed = set(deleted_todo_ids(current_user_id, since))
+        if is_done is not None:
+            removed.update(row[0] for row in select_todos(current_user_id, (), is_done=not is_done, since=since))
+        # a deleted id that SQLite handed out again is a current todo now
+        removed.difference_update(row[0] for row in rows)
+        todos["deleted"] = sorted(removed)
+
+    response = jsonify(todos)
+    if cacheable:
+        user_cache.set(todos_key(current_user_id), response.get_data(), etag, token)
+    return private_todos_response(response, etag), 200
+
+
+@api.route('/todos/search', methods=['GET'])
+@jwt_required()
+def search_todos():
+    """
+    Searches the user's todo labels: ?q= words (each matched as a prefix, all required),
+    best matches first. Paginated with limit (default 20) and offset (next_offset).
+    "match" tells whether the full-text index answered or the substring fallback did.
+    """
+    current_user_id = get_jwt_identity()
+    words = query_words(request.args.get("q"))
+    if not words:
+        raise APIException("'q' must contain at least one word", status_code=400)
+    limit = parse_int("limit", minimum=1, maximum=MAX_SEARCH_PAGE) or 20
+    offset = parse_int("offset", maximum=MAX_SEARCH_OFFSET) or 0
+
+    # one extra row tells whether there is a next page
+    rows, match = search_todo_labels(current_user_id, words, limit + 1, offset)
+    return jsonify({
+        "todos": [Todos.serialize_row(row) for row in rows[:limit]],
+        "match": match,
+        "next_offset": offset + limit if len(rows) > limit else None,
+    }), 200
 
-    return jsonify(todos), 200
+
+@api.route('/todos/stream', methods=['GET'])
+@jwt_required(locations=["headers", "query_string"])
+def stream_todos():
+    """
+    Server-sent events with the user's todo changes: `created`/`updated` (the todo),
+    `deleted` ({"id"}), `imported` ({"count"}), plus `ready` on connect and `resync`
+    ({"since": version}) when the client must reload with GET /todos?since=.
+    The event id is the todo-list version; EventSource sends it back as Last-Event-ID
+    on reconnect. EventSource can't set headers, so the token may come as ?jwt=.
+    """
+    current_user_id = get_jwt_identity()
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        after = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise APIException("Invalid Last-Event-ID", status_code=400)
+
+    if not todo_events.max_streams:
+        return jsonify({"message": "Event streams need threaded workers (WEB_THREADS)"}), 503
+    subscriber = todo_events.subscribe(current_user_id)
+    if subscriber is None:
+        return jsonify({"message": "Too many open streams, try again later"}), 503, {"Retry-After": "5"}
+    # subscribed first, so nothing committed after this read can be missed
+    version = todos_version(current_user_id)
+    if version is None:
+        todo_events.unsubscribe(subscriber)
+        return jsonify({"message": "User not found"}), 404
+    backlog = todo_events.missed(current_user_id, after) if after is not None else []
+    db.session.close()  # the stream doesn't need the connection
+
+    response = Response(todo_events.stream(subscriber, after if after is not None else version,
+                                           backlog, current_app.json.dumps, resumed=after is not None),
+                        status=200, mimetype="text/event-stream")
+    response.call_on_close(lambda: todo_events.unsubscribe(subscriber))
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the events
+    return response
 
 
 @api.route('/todos', methods=['POST'])
@@ -171,15 +403,12 @@ def create_todo():
     if not label:
         return jsonify({"message": "Label is required"}), 400
 
-    new_todo = Todos(
-        label=label,
-        is_done=False,
-        user_id=current_user_id
-    )
-    db.session.add(new_todo)
     try:
+        version = bump_todos_version(current_user_id)
+        new_todo = Todos.serialize_row(insert_todos(current_user_id, [label], version)[0])
         db.session.commit()
-        return jsonify(new_todo.serialize()), 201
+        todo_events.publish(current_user_id, version, [("created", new_todo)])
+        return jsonify(new_todo), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Error creating todo", "error": str(e)}), 500
@@ -189,23 +418,29 @@ def create_todo():
 @jwt_required()
 def update_todo(todo_id):
     current_user_id = get_jwt_identity()
-    todo = Todos.query.filter_by(
-        id=todo_id, user_id=current_user_id).one_or_none()
-    if not todo:
-        return jsonify({"message": "Todo not found"}), 404
-
     data = request.get_json()
-    label = data.get("label")
-    is_done = data.get("is_done")
-
-    if label is not None:
-        todo.label = label
-    if is_done is not None:
-        todo.is_done = is_done
+    values = {}
+    if data.get("label") is not None:
+        values["label"] = data["label"]
+    if data.get("is_done") is not None:
+        values["is_done"] = data["is_done"]
 
+    # a single UPDATE ... WHERE id AND user_id RETURNING; no row means not found (or not ours)
     try:
+        version = None
+        if values:
+            version = bump_todos_version(current_user_id)
+            rows = update_todos(current_user_id, [todo_id], values, version)
+        else:
+            rows = [row for row in [find_todo(current_user_id, todo_id)] if row]
+        if not rows:
+            db.session.rollback()
+            return jsonify({"message": "Todo not found"}), 404
         db.session.commit()
-        return jsonify(todo.serialize()), 200
+        todo = Todos.serialize_row(rows[0])
+        if version is not None:
+            todo_events.publish(current_user_id, version, [("updated", todo)])
+        return jsonify(todo), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Error updating todo", "error": str(e)}), 500
@@ -215,15 +450,180 @@ def update_todo(todo_id):
 @jwt_required()
 def delete_todo(todo_id):
     current_user_id = get_jwt_identity()
-    todo = Todos.query.filter_by(
-        id=todo_id, user_id=current_user_id).one_or_none()
-    if not todo:
-        return jsonify({"message": "Todo not found"}), 404
-
-    db.session.delete(todo)
     try:
+        version = bump_todos_version(current_user_id)
+        deleted = delete_todos(current_user_id, [todo_id], version)
+        if not deleted:
+            db.session.rollback()
+            return jsonify({"message": "Todo not found"}), 404
         db.session.commit()
+        todo_events.publish(current_user_id, version, [("deleted", {"id": todo_id})])
         return jsonify([]), 204
     except Exception as e:
         db.session.rollback()
         return jsonify({"message": "Error deleting todo", "error": str(e)}), 500
+
+
+@api.route('/todos/batch', methods=['POST'])
+@jwt_required()
+def batch_todos():
+    """
+    Applies a list of operations in one transaction:
+        {"op": "create", "label": "..."}
+        {"op": "update", "id": 1, "label": "...", "is_done": true}
+        {"op": "delete", "id": 1}
+    The body is either that list or {"operations": [...]}. Creates run first, then
+    updates, then deletes; several updates of the same id are merged in order.
+    Returns one result per operation, in request order.
+    """
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json()
+    operations = data.get("operations") if isinstance(data, dict) else data
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"message": "A list of operations is required"}), 400
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({"message": f"At most {MAX_BATCH_OPERATIONS} operations per batch"}), 413
+
+    results = [None] * len(operations)
+    creates = []  # (index, label)
+    updates = {}  # id -> (indexes, values)
+    deletes = {}  # id -> indexes
+
+    for index, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        todo_id = operation.get("id") if op in ("update", "delete") else None
+        if op not in ("create", "update", "delete"):
+            results[index] = {"status": 400, "message": "Unknown operation"}
+        elif op != "create" and (not isinstance(todo_id, int) or isinstance(todo_id, bool)):
+            results[index] = {"status": 400, "message": "An integer id is required"}
+        elif op == "create":
+            label = operation.get("label")
+            if not label or not isinstance(label, str):
+                results[index] = {"status": 400, "message": "Label is required"}
+            else:
+                creates.append((index, label))
+        elif op == "update":
+            values = {}
+            if operation.get("label") is not None:
+                values["label"] = operation["label"]
+            if operation.get("is_done") is not None:
+                values["is_done"] = operation["is_done"]
+            if not isinstance(values.get("label", ""), str) or not isinstance(values.get("is_done", False), bool):
+                results[index] = {"status": 400, "message": "Invalid label or is_done"}
+            elif not values:
+                results[index] = {"status": 400, "message": "Nothing to update"}
+            else:
+                indexes, merged = updates.setdefault(todo_id, ([], {}))
+                indexes.append(index)
+                merged.update(values)
+        else:
+            deletes.setdefault(todo_id, []).append(index)
+
+    try:
+        version = bump_todos_version(current_user_id) if creates or updates or deletes else None
+        for (index, _), row in zip(creates, insert_todos(current_user_id, [label for _, label in creates], version)):
+            results[index] = {"status": 201, "todo": Todos.serialize_row(row)}
+
+        # one UPDATE ... WHERE id IN (...) per distinct set of values
+        groups = {}
+        for todo_id, (_, values) in updates.items():
+            groups.setdefault(tuple(sorted(values.items())), []).append(todo_id)
+        updated = {}
+        for values, ids in groups.items():
+            for row in update_todos(current_user_id, ids, dict(values), version):
+                updated[row.id] = Todos.serialize_row(row)
+        for todo_id, (indexes, _) in updates.items():
+            for index in indexes:
+                results[index] = {"status": 200, "todo": updated[todo_id]} if todo_id in updated \
+                    else {"status": 404, "message": "Todo not found"}
+
+        deleted = set(delete_todos(current_user_id, list(deletes), version)) if deletes else set()
+        for todo_id, indexes in deletes.items():
+            for index in indexes:
+                results[index] = {"status": 204} if todo_id in deleted \
+                    else {"status": 404, "message": "Todo not found"}
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Error applying batch", "error": str(e)}), 500
+
+    changes = [("created", results[index]["todo"]) for index, _ in creates]
+    changes += [("updated", todo) for todo in updated.values()]
+    changes += [("deleted", {"id": todo_id}) for todo_id in sorted(deleted)]
+    if changes:
+        todo_events.publish(current_user_id, version, changes)
+
+    return jsonify({"results": results}), 200
+
+
+@api.route('/todos/export', methods=['GET'])
+@jwt_required()
+def export_todos():
+    """
+    Streams all the user's todos as NDJSON (default) or CSV: ?format=ndjson|csv, and
+    ?fields= as in GET /todos. X-Todos-Version is the list version at the start of the
+    export, to continue from with GET /todos?since=.
+    """
+    current_user_id = get_jwt_identity()
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in FORMATS:
+        raise APIException("'format' must be ndjson or csv", status_code=400)
+    fields = parse_fields(TODO_FIELDS)
+
+    version = todos_version(current_user_id)
+    if version is None:
+        return jsonify({"message": "User not found"}), 404
+
+    headers = {"X-Todos-Version": str(version),
+               "Content-Disposition": f'attachment; filename="todos.{fmt}"'}
+    chunks = export_chunks(iter_todos(current_user_id, fields), fmt, fields)
+    return Response(stream_with_context(chunks), status=200, mimetype=FORMATS[fmt], headers=headers)
+
+
+@api.route('/todos/import', methods=['POST'])
+@jwt_required()
+def import_todos():
+    """
+    Adds the todos of an NDJSON or CSV upload (see api/transfer.py), format taken from
+    ?format= or the Content-Type. The body is parsed as it arrives and written
+    IMPORT_CHUNK_SIZE rows per transaction, so if something fails the chunks already
+    committed stay. Invalid rows are skipped and reported by line number.
+    """
+    current_user_id = int(get_jwt_identity())
+    fmt = request.args.get("format") or CONTENT_TYPES.get(request.mimetype)
+    if fmt not in FORMATS:
+        return jsonify({"message": "Send NDJSON or CSV (Content-Type or ?format=)"}), 415
+
+    version = todos_version(current_user_id)
+    if version is None:
+        return jsonify({"message": "User not found"}), 404
+
+    imported, failed, errors, chunk = 0, 0, [], []
+    try:
+        for line, todo in parse_import(request.stream, fmt):
+            if isinstance(todo, str):
+                failed += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append({"line": line, "message": todo})
+                continue
+            chunk.append(todo)
+            if len(chunk) == IMPORT_CHUNK_SIZE:
+                version = bump_todos_version(current_user_id)
+                append_todos(current_user_id, chunk, version)
+                db.session.commit()
+                todo_events.publish(current_user_id, version, [("imported", {"count": len(chunk)})])
+                imported += len(chunk)
+                chunk = []
+        if chunk:
+            version = bump_todos_version(current_user_id)
+            append_todos(current_user_id, chunk, version)
+            db.session.commit()
+            todo_events.publish(current_user_id, version, [("imported", {"count": len(chunk)})])
+            imported += len(chunk)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": "Error importing todos", "error": str(e),
+                        "imported": imported, "failed": failed, "errors": errors, "version": version}), 500
+
+    return jsonify({"imported": imported, "failed": failed, "errors": errors, "version": version}), 200
@@ -0,0 +1,116 @@
+"""
+Search over todo labels for GET /api/todos/search.
+
+Every word of the query matches as a prefix ("pan" finds "pantalón"), all the words must
+match, and the best matches come first. The index is maintained by a migration:
+
+    SQLite    FTS5 table todos_fts (owner, label), kept in sync with todos by triggers and
+              ranked with bm25. The owner column holds the user id, so a search intersects
+              that user's postings with the words instead of filtering everyone's matches.
+              A second one, todos_fts_trigram, serves the substring fallback the same way.
+    Postgres  GIN index on (user_id, to_tsvector('simple', label)), ranked with ts_rank;
+              a pg_trgm index on (user_id, label) serves the substring fallback.
+
+When the full-text index has no match at all, todos whose label contains the words
+anywhere are returned by id. Words of one or two letters are shorter than a trigram, so
+on SQLite they only filter what the longer words found; a query made of nothing else, or
+a database without the indexes (made with create_all, as in tests), scans the user's todos.
+"""
+import re
+from api.models import db, Todos
+from api.queries import todo_columns
+
+FTS_TABLE = "todos_fts"
+TRIGRAM_TABLE = "todos_fts_trigram"
+MAX_WORDS = 8
+WORD = re.compile(r"\w+")
+TS_CONFIG = db.literal_column("'simple'")  # a literal, so the planner matches the index expression
+
+_fts_tables = {}  # (engine url, table name) -> whether the table exists
+
+
+def query_words(q):
+    return WORD.findall(q or "")[:MAX_WORDS]
+
+
+def _has_fts_table(name=FTS_TABLE):
+    key = (str(db.engine.url), name)
+    if key not in _fts_tables:
+        _fts_tables[key] = db.session.execute(db.text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}).first() is not None
+    return _fts_tables[key]
+
+
+def _like_pattern(word):
+    return "%" + word.replace("\\", "\\\\").replace("_", "\\_") + "%"
+
+
+def fulltext_search(user_id, words, limit, offset=0):
+    """Ranked rows of the todo columns, or None when this database has no full-text index."""
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite" and _has_fts_table():
+        # words are \w+ runs, so they can be quoted as FTS5 strings as they are
+        match = f'owner:"{int(user_id)}" AND label:(' + " AND ".join(f'"{word}"*' for word in words) + ")"
+        statement = db.text(
+            f"SELECT todos.id, todos.label, todos.is_done, todos.user_id FROM {FTS_TABLE} "
+            f"JOIN todos ON todos.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, 0.0, 1.0), todos.id LIMIT :limit OFFSET :offset"
+        ).columns(*todo_columns())
+        return db.session.execute(statement, {"match": match, "limit": limit, "offset": offset}).all()
+    if dialect == "postgresql":
+        vector = db.func.to_tsvector(TS_CONFIG, Todos.label)
+        tsquery = db.func.to_tsquery(TS_CONFIG, " & ".join(f"{word}:*" for word in words))
+        statement = db.select(*todo_columns()).where(
+            Todos.user_id == user_id, vector.op("@@")(tsquery)
+        ).order_by(db.func.ts_rank(vector, tsquery).desc(), Todos.id).limit(limit).offset(offset)
+        return db.session.execute(statement).all()
+    return None
+
+
+def trigram_search(user_id, words, limit, offset=0):
+    """substring_search through the SQLite trigram index, or None when it can't be used."""
+    long_words = [word for word in words if len(word) >= 3]
+    if db.engine.dialect.name != "sqlite" or not long_words or not _has_fts_table(TRIGRAM_TABLE):
+        return None
+    match = f'owner:"u{int(user_id)}u" AND ' + " AND ".join(f'label:"{word}"' for word in long_words)
+    params = {"match": match, "limit": limit, "offset": offset}
+    columns = "todos.id, todos.label, todos.is_done, todos.user_id"
+    short_words = [word for word in words if len(word) < 3]
+    if short_words:
+        # the index walks the matches in rowid order, so the first page stops early
+        params.update((f"pattern{i}", _like_pattern(word)) for i, word in enumerate(short_words))
+        conditions = "".join(f" AND lower(todos.label) LIKE lower(:pattern{i}) ESCAPE '\\'"
+                             for i in range(len(short_words)))
+        statement = db.text(
+            f"SELECT {columns} FROM {TRIGRAM_TABLE} JOIN todos ON todos.id = {TRIGRAM_TABLE}.rowid "
+            f"WHERE {TRIGRAM_TABLE} MATCH :match{conditions} "
+            f"ORDER BY {TRIGRAM_TABLE}.rowid LIMIT :limit OFFSET :offset")
+    else:
+        statement = db.text(
+            f"SELECT {columns} FROM (SELECT rowid FROM {TRIGRAM_TABLE} WHERE {TRIGRAM_TABLE} MATCH :match "
+            f"ORDER BY rowid LIMIT :limit OFFSET :offset) AS found JOIN todos ON todos.id = found.rowid "
+            f"ORDER BY todos.id")
+    return db.session.execute(statement.columns(*todo_columns()), params).all()
+
+
+def substring_search(user_id, words, limit, offset=0):
+    """Rows whose label contains every word, by id."""
+    rows = trigram_search(user_id, words, limit, offset)
+    if rows is not None:
+        return rows
+    patterns = [_like_pattern(word) for word in words]
+    statement = db.select(*todo_columns()).where(
+        Todos.user_id == user_id, *[Todos.label.ilike(pattern, escape="\\") for pattern in patterns]
+    ).order_by(Todos.id).limit(limit).offset(offset)
+    return db.session.execute(statement).all()
+
+
+def search_todo_labels(user_id, words, limit, offset=0):
+    """(rows, "fulltext" | "substring") for one page of results."""
+    rows = fulltext_search(user_id, words, limit, offset)
+    if rows is None:
+        return substring_search(user_id, words, limit, offset), "substring"
+    if rows or (offset and fulltext_search(user_id, words, 1)):
+        return rows, "fulltext"
+    # no full-text match at all: maybe the words are in the middle of longer ones
+    return substring_search(user_id, words, limit, offset), "substring"
@@ -0,0 +1,88 @@
+"""
+Bulk generation of users and todos for development and performance testing
+(`flask insert-test-users` / `flask insert-test-data`).
+
+Every generated user gets the same salt and password hash, computed once up front, so
+seeding costs no KDF time per user. Rows are written a chunk at a time: users with one
+executemany INSERT .. RETURNING id, their todos with one executemany INSERT, or on
+Postgres (psycopg2) with COPY, then a commit per chunk.
+"""
+import csv
+import io
+import os
+import time
+from base64 import b64encode
+from api.models import db, User, Todos
+from api.passwords import passwords
+from api.queries import version_datetime
+
+DEFAULT_PASSWORD = "123456"
+
+
+def _copy_todos(rows):
+    """COPY (label, is_done, user_id, created_at, updated_at) rows into todos."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    dbapi_connection = db.session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY todos (label, is_done, user_id, created_at, updated_at) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def next_user_number(prefix):
+    """
+    The highest n of the <prefix><n>@test.com users already there, so generated emails
+    continue after it (deleted users leave gaps, so counting them isn't enough).
+    """
+    pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%@test.com"
+    # the longest, then lexically greatest email holds the greatest number
+    query = db.select(User.email).where(User.email.like(pattern, escape="\\")).order_by(
+        db.func.length(User.email).desc(), User.email.desc())
+    with db.session.execute(query.execution_options(yield_per=1000)) as result:
+        for email in result.scalars():
+            number = email[len(prefix):-len("@test.com")]
+            if number.isascii() and number.isdigit() and number == str(int(number)):
+                return int(number)
+    return 0
+
+
+def generate_test_data(users, todos_per_user=0, chunk_size=5000, password=DEFAULT_PASSWORD,
+                       prefix="test_user", progress=None):
+    """
+    Create `users` users (emails <prefix><n>@test.com, all with `password`), each with
+    `todos_per_user` todos. `progress(users_done, rows_done, seconds)` is called after
+    every committed chunk. Returns (users, rows, seconds).
+    """
+    started = time.perf_counter()
+    salt = b64encode(os.urandom(32)).decode("utf-8")
+    password_hash = passwords.hash(password + salt)
+    use_copy = db.engine.dialect.name == "postgresql" and db.engine.dialect.driver == "psycopg2"
+    first = next_user_number(prefix) + 1
+    user_statement = db.insert(User).returning(User.id, sort_by_parameter_order=True)
+    users_per_chunk = max(1, chunk_size // (todos_per_user + 1))
+    done = rows = 0
+
+    while done < users:
+        count = min(users_per_chunk, users - done)
+        version = int(time.time() * 1_000_000)
+        stamp = version_datetime(version)
+        ids = db.session.execute(user_statement, [
+            {"email": f"{prefix}{first + done + i}@test.com", "lastname": f"User {first + done + i}",
+             "password_hash": password_hash, "salt": salt, "is_active": True, "todos_version": version,
+             "created_at": stamp, "updated_at": stamp}
+            for i in range(count)]).scalars().all()
+        if todos_per_user:
+            todos = [(f"Todo {n + 1}", n % 3 == 0, user_id, stamp, stamp)
+                     for user_id in ids for n in range(todos_per_user)]
+            if use_copy:
+                _copy_todos(todos)
+            else:
+                db.session.execute(db.insert(Todos), [
+                    dict(zip(("label", "is_done", "user_id", "created_at", "updated_at"), todo)) for todo in todos])
+        db.session.commit()
+        done += count
+        rows += count * (todos_per_user + 1)
+        if progress:
+            progress(done, rows, time.perf_counter() - started)
+    return done, rows, time.perf_counter() - started
@@ -0,0 +1,142 @@
+"""
+Serving the SPA build in dist/.
+
+The directory is indexed once at startup: for every file we keep its size, mtime, ETag,
+mimetype and precompressed .br/.gz variants (written by `flask precompress-assets`), and
+index.html, which every client-side route falls back to, is kept in memory. Serving a
+request is then a dict lookup: no stat() calls, and only an open() for files that are not
+preloaded. Set STATIC_INDEX_POLL_SECONDS to rescan the directory periodically when the
+build can change under a running server.
+
+Fingerprinted bundles (Vite's assets/<name>-<hash>.<ext>) never change under the same
+name, so they are cached for a year as immutable; index.html and everything else must be
+revalidated on every load so a deploy is picked up immediately.
+"""
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from flask import request, Response
+from werkzeug.exceptions import NotFound
+from werkzeug.wsgi import wrap_file
+from api.compression import negotiate, ENCODING_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTED = re.compile(r"^assets/.+-[A-Za-z0-9_-]{8,}\.\w+$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+PRELOADED = ("index.html",)
+
+
+@dataclass
+class StaticFile:
+    path: str
+    size: int
+    mtime: float
+    etag: str
+    data: bytes = None
+    variants: dict = field(default_factory=dict)  # encoding -> StaticFile
+
+
+def _scan(path):
+    st = os.stat(path)
+    return StaticFile(path, st.st_size, st.st_mtime, f"{st.st_mtime_ns:x}-{st.st_size:x}")
+
+
+class StaticIndex:
+    def __init__(self, root, poll_interval=0):
+        self.root = os.path.realpath(root)
+        self.poll_interval = poll_interval
+        self._files = {}
+        self._signature = None
+        self.refresh()
+        if poll_interval:
+            threading.Thread(target=self._poll, name="static-index", daemon=True).start()
+
+    def _walk(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                yield os.path.relpath(full, self.root).replace(os.sep, "/"), full
+
+    def refresh(self):
+        files = {}
+        paths = dict(self._walk())
+        for rel, full in paths.items():
+            try:
+                entry = _scan(full)
+                for encoding, suffix in ENCODING_SUFFIXES.items():
+                    if rel + suffix in paths:
+                        entry.variants[encoding] = _scan(paths[rel + suffix])
+                if rel in PRELOADED:
+                    for item in [entry, *entry.variants.values()]:
+                        with open(item.path, "rb") as f:
+                            item.data = f.read()
+            except OSError:
+                continue  # removed while scanning; the next refresh settles it
+            files[rel] = entry
+        self._files = files
+        self._signature = self._current_signature()
+
+    def _current_signature(self):
+        # cheap change detection: directory mtimes change when files are added, removed or renamed
+        signature = []
+        for dirpath, _, filenames in os.walk(self.root):
+            signature.append((dirpath, os.stat(dirpath).st_mtime_ns, len(filenames)))
+        return tuple(signature)
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                if self._current_signature() != self._signature:
+                    self.refresh()
+                    logger.info("reindexed %d static files in %s", len(self._files), self.root)
+            except OSError:
+                logger.exception("static index refresh failed")
+
+    def __contains__(self, path):
+        return path in self._files
+
+    def response(self, path):
+        """Response for `path`, falling back to index.html for client-side routes."""
+        entry = self._files.get(path)
+        if entry is None:
+            path = "index.html"
+            entry = self._files.get(path)
+            if entry is None:
+                raise NotFound()
+
+        encoding = negotiate(request, entry.variants) if entry.variants else None
+        item = entry.variants[encoding] if encoding else entry
+        if item.data is not None:
+            body = [item.data]
+        else:
+            try:
+                body = wrap_file(request.environ, open(item.path, "rb"))
+            except OSError:
+                # deleted since the last scan
+                self.refresh()
+                raise NotFound()
+
+        response = Response(body, mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                            direct_passthrough=True)
+        response.content_length = item.size
+        response.last_modified = item.mtime
+        response.set_etag(item.etag + ("-" + encoding if encoding else ""))
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if entry.variants:
+            response.vary.add("Accept-Encoding")
+
+        if FINGERPRINTED.match(path):
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+            response.cache_control.max_age = 0
+        return response.make_conditional(request, accept_ranges=True, complete_length=item.size)
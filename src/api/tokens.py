@@ -0,0 +1,106 @@
+"""
+JWTManager that remembers the tokens it has already verified.
+
+A session sends the same access token with every request, and flask_jwt_extended
+decodes it and checks its signature each time. Here the claims of a verified token are
+kept under the sha256 of the token until the token expires, so a repeated token costs a
+hash and a dict lookup. Only the decode is skipped: the blocklist callback still runs on
+every request (api.revocation), so a logged-out token is rejected as before.
+
+The hook, JWTManager._decode_jwt_from_config, is private to flask-jwt-extended (pinned to
+4.x in the Pipfile). If an installed version has a different signature, tokens are
+decoded in full every time instead.
+
+    JWT_VERIFIED_CACHE_SIZE  tokens remembered per process, default 10000 (0 disables)
+"""
+import hashlib
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.config import config
+
+logger = logging.getLogger(__name__)
+
+_HOOK_PARAMETERS = ("self", "encoded_token", "csrf_value", "allow_expired")
+
+
+def _hook_supported():
+    hook = getattr(JWTManager, "_decode_jwt_from_config", None)
+    return callable(hook) and tuple(inspect.signature(hook).parameters) == _HOOK_PARAMETERS
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # sha256 of the token -> (claims, valid until)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key, claims, valid_until):
+        with self._lock:
+            self._entries[key] = (claims, valid_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def collect(self):
+        return {**self.stats, "entries": len(self._entries)}
+
+
+class CachingJWTManager(JWTManager):
+    def __init__(self, app=None, add_context_processor=False, max_entries=None):
+        if max_entries is None:
+            max_entries = int(os.getenv("JWT_VERIFIED_CACHE_SIZE", 10_000))
+        if max_entries and not _hook_supported():
+            logger.warning("flask-jwt-extended changed JWTManager._decode_jwt_from_config, "
+                           "the verified-token cache is off")
+            max_entries = 0
+        self.verified_tokens = VerifiedTokenCache(max_entries)
+        super().__init__(app, add_context_processor)
+
+    def _decode_jwt_from_config(self, *args, **kwargs):
+        if not self.verified_tokens.max_entries:
+            return super()._decode_jwt_from_config(*args, **kwargs)
+        return self._decode_cached(*args, **kwargs)
+
+    def _decode_cached(self, encoded_token, csrf_value=None, allow_expired=False):
+        # a CSRF value is checked against the claims, so those decodes always run in full
+        if csrf_value is not None:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        key = hashlib.sha256(encoded_token.encode()).digest()
+        claims = self.verified_tokens.get(key)
+        if claims is None:
+            # expired, invalid or unknown tokens get the full decode and its errors
+            claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+            exp = claims.get("exp")
+            if exp is None:
+                return claims  # only tokens that expire are remembered
+            leeway = config.leeway  # seconds or a timedelta, as pyjwt takes it
+            valid_until = exp + (leeway.total_seconds() if isinstance(leeway, timedelta) else leeway)
+            if valid_until > time.time():
+                self.verified_tokens.set(key, claims, valid_until)
+        # callers get their own dict, the cached claims are never handed out
+        return dict(claims)
@@ -0,0 +1,99 @@
+"""
+Export and import of todo lists as NDJSON or CSV (GET /api/todos/export, POST /api/todos/import).
+
+Both directions stream: the export encodes rows as they come off a server-side cursor
+and the import parses the request body line by line, so memory stays flat whatever the
+size of the list.
+
+    NDJSON  one object per line: {"label": "...", "is_done": false}
+    CSV     a header row naming the columns (label required, is_done optional)
+
+Other keys and columns (id, user_id, ... from an export) are ignored on import.
+"""
+import csv
+import io
+import json
+from flask import current_app
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CONTENT_TYPES = {"application/x-ndjson": "ndjson", "application/jsonl": "ndjson",
+                 "application/json": "ndjson", "text/csv": "csv"}
+MAX_LABEL_LENGTH = 255
+
+
+def export_chunks(rows, fmt, fields, chunk_size=1000):
+    """Encode (id, *fields) rows in `fmt`, yielding text `chunk_size` rows at a time."""
+    dumps = current_app.json.dumps
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(fields)
+    count = 0
+    for row in rows:
+        values = row[1:]
+        if writer:
+            writer.writerow(["true" if v is True else "false" if v is False else v for v in values])
+        else:
+            buffer.write(dumps(dict(zip(fields, values))))
+            buffer.write("\n")
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    value = str(value).strip().lower()
+    if value in ("1", "true", "yes"):
+        return True
+    if value in ("", "0", "false", "no"):
+        return False
+    raise ValueError("is_done must be a boolean")
+
+
+def _todo(record):
+    label = record.get("label")
+    if not isinstance(label, str) or not label.strip():
+        raise ValueError("label is required")
+    if len(label) > MAX_LABEL_LENGTH:
+        raise ValueError(f"label is longer than {MAX_LABEL_LENGTH} characters")
+    return label, _parse_bool(record.get("is_done"))
+
+
+def parse_import(stream, fmt):
+    """
+    Yield (line, (label, is_done)) or (line, error message) for every record of the
+    binary `stream`, reading it incrementally.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        try:
+            for record in reader:
+                try:
+                    yield reader.line_num, _todo(record)
+                except ValueError as e:
+                    yield reader.line_num, str(e)
+        except (csv.Error, UnicodeDecodeError) as e:
+            yield reader.line_num, f"unreadable CSV: {e}"
+        return
+
+    line = 0
+    try:
+        for line, raw in enumerate(text, 1):
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+                if not isinstance(record, dict):
+                    raise ValueError("expected a JSON object")
+                yield line, _todo(record)
+            except ValueError as e:
+                yield line, str(e)
+    except UnicodeDecodeError as e:
+        yield line + 1, f"not UTF-8: {e}"
@@ -1,7 +1,8 @@
-from flask import jsonify, url_for
+from flask import jsonify, url_for, current_app
 
 class APIException(Exception):
     status_code = 400
+    headers = None  # extra response headers, e.g. Retry-After
 
     def __init__(self, message, status_code=None, payload=None):
         Exception.__init__(self)
@@ -15,6 +16,22 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def stream_json_array(items, chunk_size=500):
+    """Encode an iterable of dicts as a JSON array, yielding it in chunks of `chunk_size` items."""
+    dumps = current_app.json.dumps
+    yield "["
+    chunk = []
+    first = True
+    for item in items:
+        chunk.append(dumps(item))
+        if len(chunk) == chunk_size:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield "]"
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
@@ -1,25 +1,50 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
+import logging
 import os
-from flask import Flask, request, jsonify, url_for, send_from_directory
+from flask import Flask, request, jsonify, url_for
+from flask.logging import default_handler
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from api.utils import APIException, generate_sitemap
-from api.models import db, RevokedToken
+from api.json_provider import FastJSONProvider
+from api.compression import setup_compression
+from api.metrics import metrics, setup_metrics
+from api.profiling import setup_profiling
+from api.passwords import passwords
+from api.static_files import StaticIndex
+from api.models import db
+from api.database import engine_options, setup_engine
+from api.revocation import revoked_tokens, start_purge_scheduler
+from api.journal import journal_path
+from api.ratelimit import login_limiter
+from api.cache import user_cache, setup_cache
+from api.events import todo_events
 from api.routes import api
 from api.admin import setup_admin
 from api.commands import setup_commands
-from flask_jwt_extended import JWTManager
+from api.tokens import CachingJWTManager
 
 # from models import Person
 
 ENV = "development" if os.getenv("FLASK_DEBUG") == "1" else "production"
 static_file_dir = os.path.join(os.path.dirname(
     os.path.realpath(__file__)), '../dist/')
+# dist/ is indexed once so serving a file needs no filesystem lookups
+static_files = StaticIndex(static_file_dir, poll_interval=float(
+    os.getenv("STATIC_INDEX_POLL_SECONDS", 0)))
 app = Flask(__name__)
 app.url_map.strict_slashes = False
 
+# the api.* modules report startup settings and background jobs at INFO; without this
+# they'd be filtered by the root logger's WARNING level (LOG_LEVEL overrides)
+api_logger = logging.getLogger("api")
+api_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+if not logging.getLogger().handlers:
+    api_logger.addHandler(default_handler)
+app.json = FastJSONProvider(app)
+
 # database condiguration
 db_url = os.getenv("DATABASE_URL")
 if db_url is not None:
@@ -29,10 +54,41 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# pool sizing / pre-ping / timeouts for Postgres, busy timeout for SQLite (see api/database.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'])
 MIGRATE = Migrate(app, db, compare_type=True)
 db.init_app(app)
-app.config["JWT_SECRET_KEY"] = "super-secret"
-jwt = JWTManager(app)
+setup_engine(app, db)
+# every worker and host has to sign with the same key, so it comes from the environment
+app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
+if not app.config["JWT_SECRET_KEY"]:
+    if ENV == "production":
+        # with a known key anyone could sign a token for any user id
+        raise RuntimeError("JWT_SECRET_KEY is not set")
+    app.config["JWT_SECRET_KEY"] = "super-secret"
+# verified tokens are remembered until they expire; revocation is still checked on every request
+jwt = CachingJWTManager(app)
+
+# share revocations between the gunicorn workers of this host
+revoked_tokens.use_journal(
+    os.getenv("REVOCATION_JOURNAL") or journal_path(
+        "revoked_tokens", app.config['SQLALCHEMY_DATABASE_URI']),
+    poll_interval=float(os.getenv("REVOCATION_JOURNAL_POLL_SECONDS", 0)))
+# ...and newly registered emails, so no worker keeps them in its unknown-email cache
+login_limiter.use_journal(journal_path(
+    "login_known_emails", app.config['SQLALCHEMY_DATABASE_URI']))
+
+# todo changes for /api/todos/stream reach the streams open in every worker
+todo_events.use_journal(journal_path("todo_events", app.config['SQLALCHEMY_DATABASE_URI']))
+
+# cached /api/me and todo list bodies, dropped when the transaction changing them commits
+setup_cache(app)
+
+# optionally delete expired revoked tokens in the background (the `flask purge-revoked-tokens` command does the same on demand)
+if os.getenv("REVOKED_TOKEN_PURGE_SECONDS"):
+    start_purge_scheduler(app, float(os.getenv("REVOKED_TOKEN_PURGE_SECONDS")),
+                          batch_size=int(os.getenv("REVOKED_TOKEN_PURGE_BATCH", 1000)))
 
 # add the admin
 setup_admin(app)
@@ -40,6 +96,21 @@ setup_admin(app)
 # add the admin
 setup_commands(app)
 
+# per-endpoint latency/size/SQL metrics on /api/metrics (registered first so it sees the final response)
+setup_metrics(app, db)
+metrics.add_collector("revocation", lambda: revoked_tokens.stats)
+metrics.add_collector("password_hash", lambda: passwords.stats, gauges=("queue_seconds_max",))
+metrics.add_collector("login_limiter", lambda: login_limiter.stats)
+metrics.add_collector("user_cache", user_cache.collect, gauges=("entries", "bytes"))
+metrics.add_collector("todo_events", lambda: todo_events.stats, gauges=("streams",))
+metrics.add_collector("jwt_verified_tokens", jwt.verified_tokens.collect, gauges=("entries",))
+
+# QUERY_PROFILING=1 reports statement counts, N+1 patterns and slow queries per request
+setup_profiling(app)
+
+# gzip/brotli for API responses
+setup_compression(app)
+
 # Add all endpoints form the API with a "api" prefix
 app.register_blueprint(api, url_prefix='/api')
 
@@ -48,7 +119,7 @@ app.register_blueprint(api, url_prefix='/api')
 
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
-    return jsonify(error.to_dict()), error.status_code
+    return jsonify(error.to_dict()), error.status_code, error.headers or {}
 
 # generate sitemap with all your endpoints
 
@@ -57,18 +128,16 @@ def handle_invalid_usage(error):
 def sitemap():
     if ENV == "development":
         return generate_sitemap(app)
-    return send_from_directory(static_file_dir, 'index.html')
+    return static_files.response('index.html')
 
 # any other endpoint will try to serve it like a static file
 
 
 @app.route('/<path:path>', methods=['GET'])
 def serve_any_other_file(path):
-    if not os.path.isfile(os.path.join(static_file_dir, path)):
-        path = 'index.html'
-    response = send_from_directory(static_file_dir, path)
-    response.cache_control.max_age = 0  # avoid cache memory
-    return response
+    # unknown paths fall back to index.html; precompressed variants and
+    # long-lived caching for fingerprinted bundles are handled by the index
+    return static_files.response(path)
 
 
 @jwt.token_in_blocklist_loader
@@ -77,7 +146,8 @@ def check_if_token_revoked(jwt_header, jwt_payload):
     if not jti:
         return False
     # devuelve True si el token está revocado (entonces flask_jwt_extended lo rechazará)
-    return RevokedToken.query.filter_by(jti=jti).first() is not None
+    # the bloom filter only sends possible positives to the revoked_token table
+    return revoked_tokens.is_revoked(jti)
 
 
 # this only runs if `$ python src/main.py` is executed
@@ -0,0 +1,14 @@
+
+# ASGI entry point: the same app behind an event-loop server, with the views on a thread pool.
+# Run it with uvicorn:
+#   uvicorn asgi:application --app-dir ./src/ --host 0.0.0.0 --port 3001 --workers 2
+# or under gunicorn's process management:
+#   gunicorn asgi:application --chdir ./src/ -k uvicorn.workers.UvicornWorker
+
+from app import app
+from api.asgi import WSGIThreadAdapter
+from api.events import todo_events
+
+application = WSGIThreadAdapter(app)
+# every open event stream holds one of the adapter's threads
+todo_events.fit_threads(application.threads)
@@ -1,7 +1,13 @@
 # This file was created to run the application on heroku using gunicorn.
 # Read more about it here: https://devcenter.heroku.com/articles/python-gunicorn
 
+import os
 from app import app as application
+from api.events import todo_events
+
+# the gthread workers of the Procfile serve requests on WEB_THREADS threads each;
+# every open event stream holds one of them
+todo_events.fit_threads(int(os.getenv("WEB_THREADS") or 1))
 
 if __name__ == "__main__":
     application.run()